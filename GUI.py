@@ -1,11 +1,24 @@
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
 from tkcalendar import Calendar
 
 from http_log import HttpLog, HttpLogEntry
+from log_export import export
+from log_views import EntryView
+from time_index import DATETIME_FORMAT, parse_date, to_epoch
 from datetime import datetime, timedelta
 
+POLL_INTERVAL_MS = 50
+LIVE_INTERVAL_MS = 1000
+LIST_CHUNK = 5000
+TIMELINE_HEIGHT = 80
+TIMELINE_BAR_PX = 3
+EXPORT_FILE_TYPES = [("CSV", "*.csv"), ("JSON lines", "*.jsonl"), ("Parquet", "*.parquet")]
+
 
 class LogViewer:
     def __init__(self, root):
@@ -14,9 +27,20 @@ class LogViewer:
 
         self.current_index = -1
 
+        self.log = None
         self.logs = []
         self.filtered_logs = []
 
+        self.load_queue = None
+        self.load_cancel = None
+        self.export_queue = None
+        self.load_started = 0.0
+        self.fill_token = None
+        self.live_token = None
+        self.date_range = (None, None)
+        self.timeline_bins = None
+        self.drag_start = None
+
         self.create_widgets()
 
     def create_widgets(self):
@@ -32,13 +56,23 @@ class LogViewer:
         load_button = tk.Button(top_frame, text="Load", command=self.load_file_from_entry)
         load_button.pack(side=tk.LEFT, padx=5)
 
+        self.cancel_button = tk.Button(top_frame, text="Cancel", command=self.cancel_loading, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+
+        self.live_var = tk.BooleanVar()
+        live_button = tk.Checkbutton(top_frame, text="Live", variable=self.live_var, command=self.toggle_live)
+        live_button.pack(side=tk.LEFT, padx=5)
+
+        self.progress_var = tk.StringVar()
+        tk.Label(self.root, textvariable=self.progress_var, anchor=tk.W).pack(fill=tk.X, padx=10)
+
         filter_frame = tk.Frame(self.root)
         filter_frame.pack(fill=tk.X, padx=10, pady=5)
 
         # --- Start date ---
         tk.Label(filter_frame, text="Od (YYYY-MM-DD):").pack(side=tk.LEFT)
         self.start_date_var = tk.StringVar()
-        self.start_date_entry = tk.Entry(filter_frame, textvariable=self.start_date_var, width=12, state='readonly')
+        self.start_date_entry = tk.Entry(filter_frame, textvariable=self.start_date_var, width=19, state='readonly')
         self.start_date_entry.pack(side=tk.LEFT, padx=5)
         start_date_button = tk.Button(filter_frame, text="📅", command=self.open_start_date_picker)
         start_date_button.pack(side=tk.LEFT)
@@ -46,13 +80,25 @@ class LogViewer:
         # --- End date ---
         tk.Label(filter_frame, text="Do (YYYY-MM-DD):").pack(side=tk.LEFT)
         self.end_date_var = tk.StringVar()
-        self.end_date_entry = tk.Entry(filter_frame, textvariable=self.end_date_var, width=12, state='readonly')
+        self.end_date_entry = tk.Entry(filter_frame, textvariable=self.end_date_var, width=19, state='readonly')
         self.end_date_entry.pack(side=tk.LEFT, padx=5)
         end_date_button = tk.Button(filter_frame, text="📅", command=self.open_end_date_picker)
         end_date_button.pack(side=tk.LEFT)
 
         filter_button = tk.Button(filter_frame, text="Filtruj", command=self.filter_dates)
         filter_button.pack(side=tk.LEFT, padx=10)
+        self.filter_button = filter_button
+
+        self.export_button = tk.Button(filter_frame, text="Export filtered", command=self.export_filtered)
+        self.export_button.pack(side=tk.LEFT, padx=5)
+
+        # Timeline: requests per bin from the log's rollups, 4xx/5xx in red; dragging across it sets the dates
+        self.timeline = tk.Canvas(self.root, height=TIMELINE_HEIGHT, bg='white', highlightthickness=0)
+        self.timeline.pack(fill=tk.X, padx=10, pady=5)
+        self.timeline.bind('<Configure>', lambda event: self.draw_timeline())
+        self.timeline.bind('<ButtonPress-1>', self.start_timeline_drag)
+        self.timeline.bind('<B1-Motion>', self.drag_timeline)
+        self.timeline.bind('<ButtonRelease-1>', self.end_timeline_drag)
         # Nawigacja logów
         nav_frame = tk.Frame(self.root)
         nav_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -116,17 +162,129 @@ class LogViewer:
         self.load_file(file_path)
 
     def load_file(self, file_path):
+        self.cancel_loading()
+
+        # a finished file's unterminated last line is a row; only a file that is still written may be mid-line
+        self.log = HttpLog(file_path, columnar=True, cache=True, load=False, live=self.live_var.get())
+        self.logs = []
+        self.filtered_logs = []
+        self.current_index = -1
+        self.date_range = (None, None)
+
+        # parsing runs in a worker thread; the UI thread picks up finished batches from the queue
+        self.load_queue = queue.Queue()
+        self.load_cancel = threading.Event()
+        self.load_started = time.perf_counter()
+        worker = threading.Thread(target=self.load_worker, args=(self.log, self.load_queue, self.load_cancel),
+                                  daemon=True)
+        worker.start()
+
+        self.cancel_button.config(state=tk.NORMAL)
+        self.filter_button.config(state=tk.DISABLED)
+        self.progress_var.set("Loading...")
+        self.root.after(POLL_INTERVAL_MS, self.poll_loading, self.load_queue)
+        self.refresh_list()
+        self.draw_timeline()
+
+    @staticmethod
+    def load_worker(log, load_queue, cancel):
         try:
-            log = HttpLog(file_path)
-            self.logs = log.entries
-            self.filtered_logs = log.entries
-            self.log_list.delete(0, tk.END)
+            for progress in log.load_batches():
+                load_queue.put(('batch', progress))
+                if cancel.is_set():
+                    load_queue.put(('cancelled', None))
+                    return
+            load_queue.put(('done', None))
+        except Exception as e:
+            load_queue.put(('error', e))
 
-            for entry in self.filtered_logs:
-                self.log_list.insert(tk.END, entry.summary())
+    def poll_loading(self, load_queue):
+        if load_queue is not self.load_queue:
+            return
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Can't load file:\n{e}")
+        try:
+            while True:
+                kind, payload = load_queue.get_nowait()
+                if kind == 'batch':
+                    self.show_loaded_rows(payload)
+                else:
+                    self.finish_loading(kind, payload)
+                    return
+        except queue.Empty:
+            pass
+
+        self.root.after(POLL_INTERVAL_MS, self.poll_loading, load_queue)
+
+    def show_loaded_rows(self, progress):
+        self.logs = EntryView(self.log.entries, range(progress.rows))
+        self.filtered_logs = self.logs
+
+        elapsed = max(time.perf_counter() - self.load_started, 1e-6)
+        self.progress_var.set(f"{progress.rows} rows, {progress.bytes_read / 2**20:.1f} / "
+                              f"{progress.total_bytes / 2**20:.1f} MB ({progress.rows / elapsed:.0f} rows/s)")
+
+    def finish_loading(self, kind, error):
+        self.load_queue = None
+        self.cancel_button.config(state=tk.DISABLED)
+        self.filter_button.config(state=tk.NORMAL)
+
+        if kind == 'error':
+            self.progress_var.set("")
+            messagebox.showerror("Error", f"Can't load file:\n{error}")
+        elif kind == 'cancelled':
+            self.progress_var.set(f"Cancelled after {len(self.logs)} rows; reload the file to follow it live")
+        else:
+            self.progress_var.set(f"Loaded {len(self.logs)} rows in {time.perf_counter() - self.load_started:.1f} s")
+        self.draw_timeline()
+
+    def cancel_loading(self):
+        if self.load_cancel is not None:
+            self.load_cancel.set()
+
+    def toggle_live(self):
+        self.live_token = object()
+        if self.live_var.get():
+            self.root.after(LIVE_INTERVAL_MS, self.poll_live, self.live_token)
+
+    def poll_live(self, token):
+        if token is not self.live_token:
+            return
+
+        # only lines appended since the last refresh are parsed; after a cancelled load the rest of the file
+        # has not been read, and a refresh would parse all of it here on the UI thread
+        if self.log is not None and self.load_queue is None and self.log.loaded:
+            new_entries = self.log.refresh()
+            if len(new_entries):
+                self.show_new_rows(new_entries)
+
+        self.root.after(LIVE_INTERVAL_MS, self.poll_live, token)
+
+    def show_new_rows(self, new_entries):
+        unfiltered = self.filtered_logs is self.logs
+        self.logs = EntryView(self.log.entries, range(len(self.log.entries)))
+        if unfiltered:
+            self.filtered_logs = self.logs
+            self.fill_list(self.fill_token)
+        self.progress_var.set(f"Live: {len(new_entries)} new rows, {len(self.logs)} total")
+        self.draw_timeline()
+
+    def refresh_list(self):
+        self.log_list.delete(0, tk.END)
+        self.fill_token = object()
+        self.fill_list(self.fill_token)
+
+    def fill_list(self, token):
+        # the listbox is filled a chunk at a time, so the window stays responsive for large logs
+        if token is not self.fill_token:
+            return
+
+        shown = self.log_list.size()
+        pending = self.filtered_logs[shown:shown + LIST_CHUNK]
+        if len(pending):
+            self.log_list.insert(tk.END, *(entry.summary() for entry in pending))
+
+        if shown + len(pending) < len(self.filtered_logs) or self.load_queue is not None:
+            self.root.after(POLL_INTERVAL_MS, self.fill_list, token)
 
     def show_details(self, event=None):
         selection = self.log_list.curselection()
@@ -148,27 +306,132 @@ class LogViewer:
         end_date = self.end_date_var.get().strip()
 
         try:
-            start_date = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
-            end_date = datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
-            if end_date:
-                end_date = datetime.combine(end_date, datetime.max.time())
-            if start_date:
-                start_date = datetime.combine(start_date, datetime.min.time())
+            start_date = parse_date(start_date) if start_date else None
+            end_date = parse_date(end_date, end=True) if end_date else None
         except ValueError:
-            tk.messagebox.showerror("Wrong date format", "Use format YYYY-MM-DD")
+            tk.messagebox.showerror("Wrong date format", "Use format YYYY-MM-DD or YYYY-MM-DD HH:MM:SS")
             return
 
-        filtered = []
-        for entry in self.logs:
-            if (not start_date or entry.timestamp >= start_date) and (not end_date or entry.timestamp <= end_date):
-                filtered.append(entry)
+        if self.log is None:
+            return
+        self.date_range = (start_date, end_date)
+        self.filtered_logs = self.log.between(start_date, end_date)
+        self.refresh_list()
+        self.draw_timeline_selection()
+
+    def draw_timeline(self):
+        # rows are only read once loading has finished; the rollups answer every redraw after that
+        self.timeline.delete('all')
+        self.timeline_bins = None
+        if self.log is None or self.load_queue is not None or not len(self.log.entries):
+            return
 
-        self.log_list.delete(0, tk.END)
-        for entry in filtered:
-            self.log_list.insert(tk.END, entry.summary())
+        width = self.timeline.winfo_width()
+        height = self.timeline.winfo_height()
+        first, step, counts = self.log.rollups().histogram(bins=max(width // TIMELINE_BAR_PX, 1),
+                                                           columns=('requests', '4xx', '5xx'))
+        requests = counts['requests']
+        if not requests:
+            return
+        peak = max(requests) or 1
+        bar = width / len(requests)
+        for i, total in enumerate(requests):
+            errors = counts['4xx'][i] + counts['5xx'][i]
+            if total:
+                self.timeline.create_rectangle(i * bar, height - total * height / peak, (i + 1) * bar, height,
+                                               fill='steelblue', width=0)
+            if errors:
+                self.timeline.create_rectangle(i * bar, height - errors * height / peak, (i + 1) * bar, height,
+                                               fill='firebrick', width=0)
+        self.timeline_bins = (first, step, len(requests))
+        self.draw_timeline_selection()
+
+    def timeline_x(self, moment):
+        first, step, count = self.timeline_bins
+        return (to_epoch(moment) - first) / (step * count) * self.timeline.winfo_width()
+
+    def timeline_time(self, x):
+        first, step, count = self.timeline_bins
+        width = self.timeline.winfo_width()
+        return datetime.fromtimestamp(first + min(max(x, 0), width) / width * step * count)
+
+    def draw_timeline_selection(self):
+        self.timeline.delete('selection')
+        start, end = self.date_range
+        if self.timeline_bins is None or (start is None and end is None):
+            return
+        x0 = 0 if start is None else self.timeline_x(start)
+        x1 = self.timeline.winfo_width() if end is None else self.timeline_x(end)
+        self.timeline.create_rectangle(x0, 0, x1, self.timeline.winfo_height(), outline='black', tags='selection')
+
+    def start_timeline_drag(self, event):
+        if self.timeline_bins is None:
+            return
+        self.drag_start = event.x
+        self.timeline.delete('selection')
+        self.timeline.create_rectangle(event.x, 0, event.x, self.timeline.winfo_height(), outline='black',
+                                       tags='selection')
+
+    def drag_timeline(self, event):
+        if self.drag_start is not None:
+            self.timeline.coords('selection', self.drag_start, 0, event.x, self.timeline.winfo_height())
 
-        self.filtered_logs = filtered
+    def end_timeline_drag(self, event):
+        if self.drag_start is None:
+            return
+        x0, x1 = sorted((self.drag_start, event.x))
+        self.drag_start = None
+        if x1 - x0 < TIMELINE_BAR_PX:
+            # a click without a drag clears the date filter
+            self.start_date_var.set("")
+            self.end_date_var.set("")
+        else:
+            self.start_date_var.set(self.timeline_time(x0).strftime(DATETIME_FORMAT))
+            self.end_date_var.set(self.timeline_time(x1).strftime(DATETIME_FORMAT))
+        self.filter_dates()
+
+
+    def export_filtered(self):
+        if self.log is None or self.export_queue is not None:
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=EXPORT_FILE_TYPES)
+        if not file_path:
+            return
+
+        # the filtered rows are a view over the log, so writing starts without copying them
+        self.export_queue = queue.Queue()
+        worker = threading.Thread(target=self.export_worker, args=(self.filtered_logs, file_path, self.export_queue),
+                                  daemon=True)
+        worker.start()
+        self.export_button.config(state=tk.DISABLED)
+        self.root.after(POLL_INTERVAL_MS, self.poll_export, self.export_queue)
 
+    @staticmethod
+    def export_worker(entries, file_path, export_queue):
+        try:
+            rows = export(entries, file_path, progress=lambda written: export_queue.put(('progress', written)))
+            export_queue.put(('done', rows))
+        except Exception as e:
+            export_queue.put(('error', e))
+
+    def poll_export(self, export_queue):
+        try:
+            while True:
+                kind, payload = export_queue.get_nowait()
+                if kind == 'progress':
+                    self.progress_var.set(f"Exporting: {payload} rows written")
+                    continue
+                self.export_queue = None
+                self.export_button.config(state=tk.NORMAL)
+                if kind == 'error':
+                    messagebox.showerror("Error", f"Can't export:\n{payload}")
+                else:
+                    self.progress_var.set(f"Exported {payload} rows")
+                return
+        except queue.Empty:
+            pass
+
+        self.root.after(POLL_INTERVAL_MS, self.poll_export, export_queue)
 
     def update_nav_buttons(self):
         self.prev_button.config(state=tk.NORMAL if self.current_index > 0 else tk.DISABLED)
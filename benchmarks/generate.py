@@ -0,0 +1,124 @@
+import argparse
+import itertools
+import random
+
+FIELDS = ['ts', 'uid', 'id.orig_h', 'id.orig_p', 'id.resp_h', 'id.resp_p', 'trans_depth', 'method', 'host', 'uri',
+          'referrer', 'user_agent', 'request_body_len', 'response_body_len', 'status_code', 'status_msg',
+          'info_code', 'info_msg', 'filename', 'tags', 'username', 'password', 'proxied', 'orig_fuids',
+          'orig_mime_types', 'resp_fuids', 'resp_mime_types']
+
+DEFAULT_STATUS_MIX = {200: 70, 304: 8, 301: 4, 302: 4, 404: 9, 403: 2, 500: 2, 503: 1}
+DEFAULT_METHOD_MIX = {'GET': 85, 'POST': 10, 'HEAD': 4, 'OPTIONS': 1}
+EXTENSIONS = ['', '.html', '.php', '.jpg', '.png', '.gif', '.css', '.js', '.txt', '.asp']
+STATUS_MESSAGES = {200: 'OK', 304: 'Not Modified', 301: 'Moved Permanently', 302: 'Found', 404: 'Not Found',
+                   403: 'Forbidden', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class LogGenerator:
+    def __init__(self, rows, clients=1000, servers=200, uris=5000, uri_skew=1.1, status_mix=None,
+                 method_mix=None, malformed_rate=0.001, ipv6_rate=0.02, keep_alive_rate=0.3,
+                 start_ts=1331901000.0, rate=200.0, seed=0):
+        self.rows = rows
+        self.keep_alive_rate = keep_alive_rate
+        self.malformed_rate = malformed_rate
+        self.start_ts = start_ts
+        self.rate = rate
+        self.rng = random.Random(seed)
+
+        self.clients = [self._address(ipv6_rate) for _ in range(clients)]
+        self.servers = [self._address(ipv6_rate) for _ in range(servers)]
+        self.uris = [self._uri() for _ in range(uris)]
+        # Zipf-like popularity, so a few URIs and clients dominate as in real traffic
+        self.uri_weights = list(itertools.accumulate(1 / (rank + 1) ** uri_skew for rank in range(uris)))
+        self.client_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(clients)))
+
+        status_mix = status_mix or DEFAULT_STATUS_MIX
+        method_mix = method_mix or DEFAULT_METHOD_MIX
+        self.statuses = list(status_mix)
+        self.status_weights = list(itertools.accumulate(status_mix.values()))
+        self.methods = list(method_mix)
+        self.method_weights = list(itertools.accumulate(method_mix.values()))
+
+    def _address(self, ipv6_rate):
+        if self.rng.random() < ipv6_rate:
+            return '2001:db8::' + format(self.rng.getrandbits(16), 'x')
+        return f'10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}'
+
+    def _uri(self):
+        depth = self.rng.randrange(1, 4)
+        path = '/'.join(format(self.rng.getrandbits(20), 'x') for _ in range(depth))
+        return f'/{path}{self.rng.choice(EXTENSIONS)}'
+
+    def header(self):
+        return ['#separator \\x09', '#set_separator\t,', '#empty_field\t(empty)', '#unset_field\t-',
+                '#path\thttp', '#fields\t' + '\t'.join(FIELDS)]
+
+    def _malformed(self, fields):
+        kind = self.rng.randrange(4)
+        if kind == 0:
+            fields[14] = '-'
+        elif kind == 1:
+            fields[8] = 'www.example.com'
+        elif kind == 2:
+            fields[0] = 'not-a-timestamp'
+        else:
+            del fields[10:]
+        return fields
+
+    def lines(self, batch=10000):
+        rng = self.rng
+        ts = self.start_ts
+        uid = 'C0'
+        produced = 0
+
+        while produced < self.rows:
+            count = min(batch, self.rows - produced)
+            clients = rng.choices(self.clients, cum_weights=self.client_weights, k=count)
+            uris = rng.choices(self.uris, cum_weights=self.uri_weights, k=count)
+            statuses = rng.choices(self.statuses, cum_weights=self.status_weights, k=count)
+            methods = rng.choices(self.methods, cum_weights=self.method_weights, k=count)
+
+            for client, uri, status, method in zip(clients, uris, statuses, methods):
+                ts += rng.expovariate(self.rate)
+                server = rng.choice(self.servers)
+                # some requests reuse the previous connection, so uids repeat as they do in Zeek logs
+                if rng.random() >= self.keep_alive_rate:
+                    uid = 'C' + format(rng.getrandbits(60), 'x')
+                fields = [f'{ts:.6f}', uid, client,
+                          str(rng.randrange(1024, 65536)), server, '80', '1', method, server, uri, '-',
+                          'Mozilla/5.0', str(rng.randrange(0, 2048) if method == 'POST' else 0),
+                          str(rng.randrange(0, 200000)), str(status), STATUS_MESSAGES.get(status, '-'), '-', '-',
+                          '-', '(empty)', '-', '-', '-', '-', '-', '-', '-']
+                if rng.random() < self.malformed_rate:
+                    fields = self._malformed(fields)
+                yield '\t'.join(fields)
+
+            produced += count
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for line in self.header():
+                f.write(line + '\n')
+            for line in self.lines():
+                f.write(line + '\n')
+            f.write('#close\t2012-03-16-13-00-00\n')
+        return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Zeek http.log")
+    parser.add_argument('output')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--servers', type=int, default=200)
+    parser.add_argument('--uris', type=int, default=5000)
+    parser.add_argument('--malformed-rate', type=float, default=0.001)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    LogGenerator(args.rows, clients=args.clients, servers=args.servers, uris=args.uris,
+                 malformed_rate=args.malformed_rate, seed=args.seed).write(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import dict_functions
+import file_reader
+import host_stats
+import list_functions
+from benchmarks.generate import LogGenerator
+from http_log import HttpLog
+
+DEFAULT_SIZES = [100000, 1000000, 10000000]
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def dataset(rows, seed=0):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f'http_{rows}_{seed}.log')
+    if not os.path.exists(path):
+        LogGenerator(rows, seed=seed).write(path)
+    return path
+
+
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def read_tuples(path):
+    with open(path) as f:
+        return file_reader.read_log(f)
+
+
+def fixtures(path):
+    # what the benchmarks run on, loaded only when a selected benchmark needs it
+    return {
+        'path': lambda: path,
+        'tuples': lambda: read_tuples(path),
+        'columnar': lambda: HttpLog(path, columnar=True),
+    }
+
+
+def benchmarks():
+    # (name, fixture, function of the fixture)
+    return [
+        ('HttpLog.load', 'path', lambda path: HttpLog(path)),
+        ('HttpLog.load[columnar]', 'path', lambda path: HttpLog(path, columnar=True)),
+        ('HttpLog.load[lazy]', 'path', lambda path: HttpLog(path, lazy=True)),
+        ('file_reader.read_log', 'path', read_tuples),
+        ('list_functions.sort_log', 'tuples', lambda tuples: list_functions.sort_log(tuples, 3)),
+        ('list_functions.get_entries_by_addr', 'tuples',
+         lambda tuples: list_functions.get_entries_by_addr(tuples, str(tuples[0][2]))),
+        ('list_functions.get_entries_by_code', 'tuples',
+         lambda tuples: list_functions.get_entries_by_code(tuples, 404)),
+        ('list_functions.get_entries_by_extension', 'tuples',
+         lambda tuples: list_functions.get_entries_by_extension(tuples, '.jpg')),
+        ('list_functions.get_failed_reads', 'tuples', lambda tuples: list_functions.get_failed_reads(tuples, True)),
+        ('dict_functions.log_to_dict', 'tuples', lambda tuples: dict_functions.log_to_dict(tuples)),
+        ('dict_functions.dict_log_host_stats', 'tuples', lambda tuples: dict_functions.dict_log_host_stats(
+            dict_functions.log_to_dict(tuples))),
+        ('host_stats.aggregate_hosts', 'tuples', lambda tuples: host_stats.aggregate_hosts(tuples)),
+        ('host_stats.aggregate_hosts[columnar]', 'columnar', lambda columnar: host_stats.aggregate_hosts(columnar)),
+        ('log_query.count[columnar]', 'columnar', lambda columnar: columnar.query().src_in('10.0.0.0/9')
+         .status_class(4, 5).method('GET', 'POST').count()),
+    ]
+
+
+def run(sizes, repeat, only=None):
+    selected = [case for case in benchmarks() if not only or any(part in case[0] for part in only)]
+    results = []
+    for rows in sizes:
+        path = dataset(rows)
+        loaders = fixtures(path)
+        loaded = {}
+        for name, fixture, func in selected:
+            if fixture not in loaded:
+                loaded[fixture] = loaders[fixture]()
+            times = measure(lambda: func(loaded[fixture]), repeat)
+            results.append({'name': name, 'rows': rows, 'repeat': repeat, 'min': min(times),
+                            'median': statistics.median(times), 'rows_per_second': rows / min(times)})
+            print(f"{name:45} {rows:>10} rows  {min(times):8.3f} s", file=sys.stderr)
+        # fixtures of one size are dropped before the next, larger one is loaded
+        loaded.clear()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark log parsing and queries on synthetic Zeek logs")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help="run only benchmarks whose name contains one of these")
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args()
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': run(args.sizes, args.repeat, args.only),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,48 +1,38 @@
 from file_reader import log_first_100k
+from host_stats import HostStats, aggregate_hosts, aggregate_hosts_parallel
+from log_groups import grouping
+from log_sketches import sketch_log
 
 
+ENTRY_KEYS = ('ts', 'uid', 'id_orig_h', 'id_oirg_p', 'id_resp_h', 'id_resp_p', 'method', 'host', 'uri', 'stat_code')
+
 def entry_to_dict(log_entry):
-    keys = ['ts', 'uid', 'id_orig_h', 'id_oirg_p', 'id_resp_h', 'id_resp_p', 'method', 'host', 'uri', 'stat_code']
-    return dict(zip(keys, log_entry))
+    return dict(zip(ENTRY_KEYS, log_entry))
 
 def log_to_dict(log):
-    log_dict = {}
-
-    for entry in log:
-        entry_dict = entry_to_dict(entry)
-        uid = entry_dict['uid']
-
-        if uid not in log_dict:
-            log_dict[uid] = []
+    # uid -> list of entry dicts, read-only; rows are grouped once and the dicts are only built per uid looked up
+    return grouping(log, 'uid').dicts(entry_to_dict)
 
-        log_dict[uid].append(entry_dict)
-
-    return log_dict
-
-def print_dict_entry_dates(dict_log):
-    ret_dict = {}
+def dict_log_host_stats(dict_log):
+    stats = {}
     for key in dict_log:
-        dict_list = dict_log[key]
-        for dict_entry in dict_list:
+        for dict_entry in dict_log[key]:
             host_ip = dict_entry['id_orig_h']
-            num_2xx = 1 if 99<dict_entry['stat_code']<1000 and int(dict_entry['stat_code']/100)==2 else 0
-            if host_ip not in ret_dict: #creating entry for ip that hasnt been encountered yet
-                ret_dict[host_ip] = {'req_count':1, 'first_req':dict_entry['ts'], 'last_req':dict_entry['ts'], 'meth_dict':{dict_entry['method']: 1}, '2xx_count': num_2xx}
-            else:
-                ret_dict[host_ip]['req_count']+=1
-                if dict_entry['ts'] < ret_dict[host_ip]['first_req']:
-                    ret_dict[host_ip]['first_req'] = dict_entry['ts']
-                elif dict_entry['ts'] > ret_dict[host_ip]['last_req']:
-                    ret_dict[host_ip]['last_req'] = dict_entry['ts']
-                ret_dict[host_ip]['meth_dict'][dict_entry['method']] = ret_dict[host_ip]['meth_dict'].get(dict_entry['method'], 0) + 1
-                ret_dict[host_ip]['2xx_count'] += num_2xx
+            if host_ip not in stats: #creating entry for ip that hasnt been encountered yet
+                stats[host_ip] = HostStats()
+            stats[host_ip].add(dict_entry['ts'], dict_entry['method'], dict_entry['stat_code'])
+    return stats
 
-    for host in ret_dict:
-        print(f"Host: {host}\nRequest count: {ret_dict[host]['req_count']}\nFirst request date: {ret_dict[host]['first_req']} \nLast request date: {ret_dict[host]['last_req']} "
+def print_host_stats(stats):
+    for host, host_stats in stats.items():
+        print(f"Host: {host}\nRequest count: {host_stats.req_count}\nFirst request date: {host_stats.first_req} \nLast request date: {host_stats.last_req} "
               f"\nMethod percentages: ")
-        for meth in ret_dict[host]['meth_dict']:
-            print(f"{meth} - {round(ret_dict[host]['meth_dict'][meth]/ret_dict[host]['req_count']*100, 2)}%")
-        print(f"2xx ratio: {round(ret_dict[host]['2xx_count']/ret_dict[host]['req_count'], 4)}\n")
+        for meth, percentage in host_stats.method_percentages().items():
+            print(f"{meth} - {round(percentage, 2)}%")
+        print(f"2xx ratio: {round(host_stats.ratio_2xx, 4)}\n")
+
+def print_dict_entry_dates(dict_log):
+    print_host_stats(dict_log_host_stats(dict_log))
 
         
 def test_entry_to_dict():
@@ -63,6 +53,25 @@ def test_print_dict_entry_dates():
     log_dict = log_to_dict(log)
     print_dict_entry_dates(log_dict)
 
+def test_aggregate_hosts():
+    print_host_stats(aggregate_hosts(log_first_100k()))
+
+def test_aggregate_hosts_parallel():
+    print_host_stats(aggregate_hosts_parallel('http_first_100k.log'))
+
+def test_sketch_top_hosts():
+    # the exact sketch counts the same rows as the dict code; the approximate one should rank them alike
+    stats = dict_log_host_stats(log_to_dict(log_first_100k()))
+    expected = sorted(((str(host), host_stats.req_count) for host, host_stats in stats.items()),
+                      key=lambda item: item[1], reverse=True)
+    exact = sketch_log('http_first_100k.log', exact=True, strict=True)
+    approximate = sketch_log('http_first_100k.log', strict=True)
+    print(f"distinct sources: dict {len(stats)}, exact {exact.distinct_sources.estimate()}, "
+          f"approximate {approximate.distinct_sources.estimate()}")
+    for (host, count), (_, exact_count), (approximate_host, approximate_count) in zip(
+            expected, exact.top_sources.most_common(), approximate.top_sources.most_common()):
+        print(f"{host} {count} {exact_count} | {approximate_host} {approximate_count}")
+
 if __name__ == '__main__':
     #test_entry_to_dict()
     #test_log_to_dict()
@@ -1,33 +1,55 @@
 import datetime
-import ipaddress
 import sys
+from collections import namedtuple
 from sys import dont_write_bytecode
 
+import log_sources
+import log_intern
+import parallel_reader
+from log_entry import decode_ts
+from log_filter import as_where
+
+class LogRecord(namedtuple('LogRecord', ['ts', 'uid', 'id_orig_h', 'id_orig_p', 'id_resp_h', 'id_resp_p',
+                                         'method', 'host', 'uri', 'stat_code'])):
+    __slots__ = ()
+
+    @property
+    def timestamp(self):
+        return datetime.datetime.fromtimestamp(self.ts)
+
+    def check(self):
+        return self
+
+
 
 def parse_log_line(line):
-    parsed_line = line.strip().split('\t')
+    return parse_log_fields(line.strip().split('\t'))
+
 
+def parse_log_fields(parsed_line):
     try:
-        ts = float(parsed_line[0])
-        uid = parsed_line[1]
-        id_orig_h = ipaddress.ip_address(parsed_line[2])
+        ts = decode_ts(parsed_line[0])
+        uid = log_intern.string(parsed_line[1])
+        id_orig_h = log_intern.address(parsed_line[2])
         id_orig_p = int(parsed_line[3])
-        id_resp_h = ipaddress.ip_address(parsed_line[4])
+        id_resp_h = log_intern.address(parsed_line[4])
         id_resp_p = int(parsed_line[5])
-        method = parsed_line[7]
-        host = ipaddress.ip_address(parsed_line[8])
-        uri = parsed_line[9]
+        method = log_intern.string(parsed_line[7])
+        host = log_intern.address(parsed_line[8])
+        uri = log_intern.string(parsed_line[9])
         stat_code = int(parsed_line[14])
 
-        timestamp = datetime.datetime.fromtimestamp(ts)
+        return LogRecord(ts, uid, id_orig_h, id_orig_p, id_resp_h,id_resp_p, method, host, uri, stat_code)
 
-        return timestamp, uid, id_orig_h, id_orig_p, id_resp_h,id_resp_p, method, host, uri, stat_code
-
-    except ValueError:
+    except (ValueError, IndexError):
         return None
 
 
 def read_log(stream):
+    # a path (plain, compressed or a glob of rotated files) is streamed from disk
+    if isinstance(stream, str):
+        stream = log_sources.iter_lines(log_sources.expand(stream))
+
     log_entries = []
 
     for line in stream:
@@ -40,9 +62,41 @@ def read_log(stream):
     return log_entries
 
 
-def log_first_100k():
-    with open('http_first_100k.log', 'r') as log_file:
-        return read_log(log_file)
+def read_log_iter(stream, where=None):
+    where = as_where(where)
+
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        parsed_line = line.split('\t')
+        if where and not where.match_fields(parsed_line):
+            continue
+        parsed_entry = parse_log_fields(parsed_line)
+        if parsed_entry and (not where or where.match_decoded(parsed_entry)):
+            yield parsed_entry
+
+
+def _read_log_range(path, start, end):
+    return read_log(parallel_reader.read_range(path, start, end))
+
+
+def read_log_parallel(path, workers=None):
+    log_entries = []
+
+    paths = log_sources.expand(path)
+    if paths == [path] and not log_sources.is_compressed(path):
+        chunks = parallel_reader.map_ranges(path, _read_log_range, workers)
+    else:
+        chunks = parallel_reader.map_files(paths, read_log, workers)
+    for chunk in chunks:
+        log_entries.extend(chunk)
+
+    return log_entries
+
+
+def log_first_100k(path='http_first_100k.log'):
+    return read_log(path)
 
 def main():
     log = log_first_100k()
@@ -1,11 +1,20 @@
 import sys
+import time
 from datetime import datetime
 
 import PyQt5.QtWidgets
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QColor, QPalette, QFont, QTextCursor
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QRectF, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QPainter, QPalette, QFont, QTextCursor
 
 from http_log import HttpLog
+from log_export import export
+from log_views import EntryView
+from time_index import DATETIME_FORMAT, parse_date, to_epoch
+
+LIVE_INTERVAL_MS = 1000
+TIMELINE_HEIGHT = 80
+TIMELINE_BAR_PX = 3
+EXPORT_FILTERS = {"CSV (*.csv)": ".csv", "JSON lines (*.jsonl)": ".jsonl", "Parquet (*.parquet)": ".parquet"}
 
 
 class DatePickerDialog(PyQt5.QtWidgets.QDialog):
@@ -26,13 +35,172 @@ class DatePickerDialog(PyQt5.QtWidgets.QDialog):
         return self.calendar.selectedDate()
 
 
+class LogListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.entries = []
+
+    def set_entries(self, entries):
+        self.beginResetModel()
+        self.entries = entries
+        self.endResetModel()
+
+    def extend_entries(self, entries):
+        first, last = len(self.entries), len(entries) - 1
+        if last < first:
+            self.entries = entries
+            return
+        self.beginInsertRows(QModelIndex(), first, last)
+        self.entries = entries
+        self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.DisplayRole):
+        # rows are only formatted when the view asks for them, i.e. for the visible viewport
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        return str(self.entries[index.row()])
+
+
+class TimelineWidget(PyQt5.QtWidgets.QWidget):
+    # requests per time bin from the log's rollups, 4xx/5xx overlaid; dragging across it selects a time range
+    range_selected = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFixedHeight(TIMELINE_HEIGHT)
+        self.log = None
+        self.bins = None
+        self.selection = None
+        self.drag_start = None
+
+    def set_log(self, log):
+        # None while a log is loading; rows are only read once it has finished
+        self.log = log
+        self.selection = None
+        self.refresh()
+
+    def refresh(self):
+        self.bins = None
+        if self.log is not None and len(self.log.entries):
+            self.bins = self.log.rollups().histogram(bins=max(self.width() // TIMELINE_BAR_PX, 1),
+                                                     columns=('requests', '4xx', '5xx'))
+        self.update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.refresh()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(25, 25, 25))
+        if self.bins is None or not self.bins[2]['requests']:
+            return
+
+        counts = self.bins[2]
+        requests = counts['requests']
+        height = self.height()
+        peak = max(requests) or 1
+        bar = self.width() / len(requests)
+        for i, total in enumerate(requests):
+            errors = counts['4xx'][i] + counts['5xx'][i]
+            painter.fillRect(QRectF(i * bar, height - total * height / peak, bar, total * height / peak),
+                             QColor(42, 130, 218))
+            painter.fillRect(QRectF(i * bar, height - errors * height / peak, bar, errors * height / peak),
+                             QColor(192, 57, 43))
+
+        if self.selection is not None:
+            x0, x1 = self.selection
+            painter.fillRect(QRectF(x0, 0, x1 - x0, height), QColor(255, 255, 255, 60))
+
+    def x_at(self, moment):
+        first, step, counts = self.bins
+        return (to_epoch(moment) - first) / (step * len(counts['requests'])) * self.width()
+
+    def time_at(self, x):
+        first, step, counts = self.bins
+        return datetime.fromtimestamp(first + min(max(x, 0), self.width()) / self.width() * step *
+                                      len(counts['requests']))
+
+    def show_range(self, start, end):
+        if self.bins is None or (start is None and end is None):
+            self.selection = None
+        else:
+            self.selection = (0 if start is None else self.x_at(start),
+                              self.width() if end is None else self.x_at(end))
+        self.update()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.bins is not None:
+            self.drag_start = event.x()
+            self.selection = (event.x(), event.x())
+            self.update()
+
+    def mouseMoveEvent(self, event):
+        if self.drag_start is not None:
+            self.selection = tuple(sorted((self.drag_start, event.x())))
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        if self.drag_start is None:
+            return
+        x0, x1 = sorted((self.drag_start, event.x()))
+        self.drag_start = None
+        if x1 - x0 < TIMELINE_BAR_PX:
+            # a click without a drag clears the date filter
+            self.range_selected.emit(None, None)
+        else:
+            self.range_selected.emit(self.time_at(x0), self.time_at(x1))
+
+
+class LoadWorker(QThread):
+    batch_loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, log, parent=None):
+        super().__init__(parent)
+        self.log = log
+
+    def run(self):
+        try:
+            for progress in self.log.load_batches():
+                self.batch_loaded.emit(progress)
+                if self.isInterruptionRequested():
+                    return
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class ExportWorker(QThread):
+    progressed = pyqtSignal(int)
+    exported = pyqtSignal(int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, entries, file_path, parent=None):
+        super().__init__(parent)
+        self.entries = entries
+        self.file_path = file_path
+
+    def run(self):
+        try:
+            self.exported.emit(export(self.entries, self.file_path, progress=self.progressed.emit))
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
 class LogViewer(PyQt5.QtWidgets.QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Log browser")
+        self.log = None
         self.logs = []
         self.filtered_logs = []
         self.current_index = -1
+        self.load_worker = None
+        self.export_worker = None
+        self.load_started = 0.0
         self.init_ui()
 
     def init_ui(self):
@@ -48,10 +216,23 @@ class LogViewer(PyQt5.QtWidgets.QMainWindow):
         self.file_entry = PyQt5.QtWidgets.QLineEdit("")
         open_button = PyQt5.QtWidgets.QPushButton("Open")
         open_button.clicked.connect(self.browse_file)
+        self.cancel_button = PyQt5.QtWidgets.QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_loading)
+        self.cancel_button.setEnabled(False)
         file_layout.addWidget(self.file_entry)
         file_layout.addWidget(open_button)
+        file_layout.addWidget(self.cancel_button)
+        self.live_checkbox = PyQt5.QtWidgets.QCheckBox("Live")
+        self.live_checkbox.toggled.connect(self.toggle_live)
+        file_layout.addWidget(self.live_checkbox)
+        self.live_timer = QTimer(self)
+        self.live_timer.setInterval(LIVE_INTERVAL_MS)
+        self.live_timer.timeout.connect(self.poll_live)
         main_layout.addLayout(file_layout)
 
+        self.progress_label = PyQt5.QtWidgets.QLabel("")
+        main_layout.addWidget(self.progress_label)
+
         # Split below into left and right
         split_layout = PyQt5.QtWidgets.QHBoxLayout()
 
@@ -85,13 +266,25 @@ class LogViewer(PyQt5.QtWidgets.QMainWindow):
         filter_button = PyQt5.QtWidgets.QPushButton("Filter")
         filter_button.clicked.connect(self.filter_dates)
         date_filter_layout.addWidget(filter_button)
+        self.filter_button = filter_button
+
+        self.export_button = PyQt5.QtWidgets.QPushButton("Export filtered")
+        self.export_button.clicked.connect(self.export_filtered)
+        date_filter_layout.addWidget(self.export_button)
 
         # Add horizontal date filter layout to left pane
         left_layout.addLayout(date_filter_layout)
 
+        self.timeline = TimelineWidget()
+        self.timeline.range_selected.connect(self.select_time_range)
+        left_layout.addWidget(self.timeline)
+
         # Log list
-        self.log_list = PyQt5.QtWidgets.QListWidget()
-        self.log_list.currentRowChanged.connect(self.show_details)
+        self.log_model = LogListModel(self)
+        self.log_list = PyQt5.QtWidgets.QListView()
+        self.log_list.setModel(self.log_model)
+        self.log_list.setUniformItemSizes(True)
+        self.log_list.selectionModel().currentChanged.connect(lambda current, _: self.show_details(current.row()))
         self.log_list.setSpacing(2)
         self.log_list.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.log_list.setTextElideMode(Qt.ElideRight)
@@ -225,28 +418,140 @@ class LogViewer(PyQt5.QtWidgets.QMainWindow):
             self.load_file(file_path)
 
     def load_file(self, file_path):
-        try:
-            log = HttpLog(file_path)
-            self.logs = log.entries
-            self.filtered_logs = log.entries
-            self.update_list()
-        except Exception as e:
-            print("Error loading file:", e)
+        self.cancel_loading()
+
+        # a finished file's unterminated last line is a row; only a file that is still written may be mid-line
+        self.log = HttpLog(file_path, columnar=True, cache=True, load=False, live=self.live_checkbox.isChecked())
+        self.logs = []
+        self.filtered_logs = []
+        self.update_list()
+        self.timeline.set_log(None)
+
+        # parsing runs in a QThread; finished batches arrive through queued signals
+        self.load_started = time.perf_counter()
+        self.load_worker = LoadWorker(self.log, self)
+        self.load_worker.batch_loaded.connect(self.show_loaded_rows)
+        self.load_worker.failed.connect(self.show_load_error)
+        self.load_worker.finished.connect(self.finish_loading)
+        self.load_worker.start()
+
+        self.cancel_button.setEnabled(True)
+        self.filter_button.setEnabled(False)
+        self.progress_label.setText("Loading...")
+
+    def show_loaded_rows(self, progress):
+        if self.sender() is not self.load_worker:
+            return
+        self.logs = EntryView(self.log.entries, range(progress.rows))
+        self.filtered_logs = self.logs
+        self.log_model.extend_entries(self.filtered_logs)
+
+        elapsed = max(time.perf_counter() - self.load_started, 1e-6)
+        self.progress_label.setText(f"{progress.rows} rows, {progress.bytes_read / 2**20:.1f} / "
+                                    f"{progress.total_bytes / 2**20:.1f} MB ({progress.rows / elapsed:.0f} rows/s)")
+
+    def show_load_error(self, message):
+        if self.sender() is self.load_worker:
+            print("Error loading file:", message)
+            self.progress_label.setText(f"Error loading file: {message}")
+
+    def finish_loading(self):
+        if self.sender() is not self.load_worker:
+            return
+        cancelled = self.load_worker.isInterruptionRequested()
+        self.load_worker = None
+        self.cancel_button.setEnabled(False)
+        self.filter_button.setEnabled(True)
+        self.timeline.set_log(self.log)
+
+        if cancelled:
+            self.progress_label.setText(f"Cancelled after {len(self.logs)} rows; reload the file to follow it live")
+        elif self.log.loaded:
+            self.progress_label.setText(f"Loaded {len(self.logs)} rows in "
+                                        f"{time.perf_counter() - self.load_started:.1f} s")
+
+    def cancel_loading(self):
+        if self.load_worker is not None:
+            self.load_worker.requestInterruption()
+
+    def toggle_live(self, checked):
+        if checked:
+            self.live_timer.start()
+        else:
+            self.live_timer.stop()
+
+    def poll_live(self):
+        # only lines appended since the last refresh are parsed; after a cancelled load the rest of the file
+        # has not been read, and a refresh would parse all of it here on the UI thread
+        if self.log is None or self.load_worker is not None or not self.log.loaded:
+            return
+        new_entries = self.log.refresh()
+        if not len(new_entries):
+            return
+        self.timeline.refresh()
+
+        unfiltered = self.filtered_logs is self.logs
+        self.logs = EntryView(self.log.entries, range(len(self.log.entries)))
+        if unfiltered:
+            self.filtered_logs = self.logs
+            self.log_model.extend_entries(self.filtered_logs)
+            self.update_nav_buttons()
+        self.progress_label.setText(f"Live: {len(new_entries)} new rows, {len(self.logs)} total")
+
+    def closeEvent(self, event):
+        if self.load_worker is not None:
+            self.load_worker.requestInterruption()
+            self.load_worker.wait()
+        if self.export_worker is not None:
+            self.export_worker.wait()
+        super().closeEvent(event)
 
     def filter_dates(self):
         try:
-            start = datetime.strptime(self.start_date_entry.text(), "%Y-%m-%d")
-            end = datetime.strptime(self.end_date_entry.text(), "%Y-%m-%d")
-            self.filtered_logs = [e for e in self.logs if start.date() <= e.timestamp.date() <= end.date()]
+            start_text = self.start_date_entry.text().strip()
+            end_text = self.end_date_entry.text().strip()
+            start = parse_date(start_text) if start_text else None
+            end = parse_date(end_text, end=True) if end_text else None
+            if self.log is None:
+                return
+            self.filtered_logs = self.log.between(start, end)
             self.update_list()
+            self.timeline.show_range(start, end)
         except Exception as e:
             print("Filter error:", e)
 
-    def update_list(self):
-        self.log_list.clear()
+    def select_time_range(self, start, end):
+        self.start_date_entry.setText("" if start is None else start.strftime(DATETIME_FORMAT))
+        self.end_date_entry.setText("" if end is None else end.strftime(DATETIME_FORMAT))
+        self.filter_dates()
+
+    def export_filtered(self):
+        if self.log is None or self.export_worker is not None:
+            return
+        file_path, selected = PyQt5.QtWidgets.QFileDialog.getSaveFileName(self, "Export filtered rows", "",
+                                                                          ";;".join(EXPORT_FILTERS))
+        if not file_path:
+            return
+        if not file_path.endswith(tuple(EXPORT_FILTERS.values())):
+            file_path += EXPORT_FILTERS.get(selected, ".csv")
+
+        # the filtered rows are a view over the log, so writing starts without copying them
+        self.export_worker = ExportWorker(self.filtered_logs, file_path, self)
+        self.export_worker.progressed.connect(
+            lambda rows: self.progress_label.setText(f"Exporting: {rows} rows written"))
+        self.export_worker.exported.connect(lambda rows: self.progress_label.setText(f"Exported {rows} rows"))
+        self.export_worker.failed.connect(lambda message: self.progress_label.setText(f"Export failed: {message}"))
+        self.export_worker.finished.connect(self.finish_export)
+        self.export_button.setEnabled(False)
+        self.export_worker.start()
+
+    def finish_export(self):
+        self.export_worker = None
+        self.export_button.setEnabled(True)
 
-        for entry in self.filtered_logs:
-            self.log_list.addItem(str(entry))
+    def update_list(self):
+        self.current_index = -1
+        self.log_model.set_entries(self.filtered_logs)
 
     def show_details(self, index):
         if 0 <= index < len(self.filtered_logs):
@@ -270,12 +575,12 @@ class LogViewer(PyQt5.QtWidgets.QMainWindow):
     def show_previous(self):
         if self.current_index > 0:
             self.current_index -= 1
-            self.log_list.setCurrentRow(self.current_index)
+            self.log_list.setCurrentIndex(self.log_model.index(self.current_index))
 
     def show_next(self):
         if self.current_index < len(self.filtered_logs) - 1:
             self.current_index += 1
-            self.log_list.setCurrentRow(self.current_index)
+            self.log_list.setCurrentIndex(self.log_model.index(self.current_index))
 
 
 def set_dark_palette(app):
@@ -337,17 +642,17 @@ def set_dark_palette(app):
             padding: 6px;
         }
 
-        QListWidget {
+        QListView {
             background-color: #1e1e1e;
             color: #f0f0f0;
             border: 1px solid #555;
             font-family: "Segoe UI";
             font-size: 20px;  
         }
-        QListWidget::item {
+        QListView::item {
             padding: 8px 16px;
         }
-        QListWidget::item:selected {
+        QListView::item:selected {
             background-color: #005a9e;  /* Darker blue */
             color: white;
             font-weight: bold;
@@ -0,0 +1,115 @@
+import datetime
+
+import file_reader
+import parallel_reader
+from log_columns import ColumnStore
+from log_views import readable
+
+
+class HostStats:
+    # first_ts and last_ts are epochs; the datetimes are only built when read
+    __slots__ = ('req_count', 'first_ts', 'last_ts', 'methods', 'count_2xx')
+
+    def __init__(self):
+        self.req_count = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.methods = {}
+        self.count_2xx = 0
+
+    def add(self, ts, method, stat_code):
+        self.req_count += 1
+        if self.first_ts is None or ts < self.first_ts:
+            self.first_ts = ts
+        if self.last_ts is None or ts > self.last_ts:
+            self.last_ts = ts
+        self.methods[method] = self.methods.get(method, 0) + 1
+        if 200 <= stat_code < 300:
+            self.count_2xx += 1
+
+    def merge(self, other):
+        self.req_count += other.req_count
+        if self.first_ts is None or (other.first_ts is not None and other.first_ts < self.first_ts):
+            self.first_ts = other.first_ts
+        if self.last_ts is None or (other.last_ts is not None and other.last_ts > self.last_ts):
+            self.last_ts = other.last_ts
+        for method, count in other.methods.items():
+            self.methods[method] = self.methods.get(method, 0) + count
+        self.count_2xx += other.count_2xx
+
+    @property
+    def first_req(self):
+        return None if self.first_ts is None else datetime.datetime.fromtimestamp(self.first_ts)
+
+    @property
+    def last_req(self):
+        return None if self.last_ts is None else datetime.datetime.fromtimestamp(self.last_ts)
+
+    @property
+    def ratio_2xx(self):
+        return self.count_2xx / self.req_count if self.req_count else 0.0
+
+    def method_percentages(self):
+        return {method: count / self.req_count * 100 for method, count in self.methods.items()}
+
+    def to_dict(self):
+        return {
+            'req_count': self.req_count,
+            'first_req': self.first_req,
+            'last_req': self.last_req,
+            'meth_dict': dict(self.methods),
+            '2xx_count': self.count_2xx,
+            '2xx_ratio': self.ratio_2xx
+        }
+
+
+def _stats_for(stats, host):
+    host_stats = stats.get(host)
+    if host_stats is None:
+        host_stats = stats[host] = HostStats()
+    return host_stats
+
+
+def _aggregate_columns(store):
+    stats = {}
+    methods = store.method.values
+
+    for host, ts, method_code, stat_code in zip(store.column_values('id_orig_h'), store.ts,
+                                                store.method_codes, store.stat_code):
+        _stats_for(stats, host).add(ts, methods[method_code], stat_code)
+    return stats
+
+
+def aggregate_hosts(log):
+    entries = getattr(log, 'entries', log)
+    if isinstance(entries, ColumnStore):
+        return _aggregate_columns(entries)
+
+    if hasattr(entries, '__getitem__'):
+        entries = (entry for _, entry in readable(entries))
+    # otherwise records streamed from a reader, which were parsed as they were read
+
+    stats = {}
+    for entry in entries:
+        _stats_for(stats, entry.id_orig_h).add(entry.ts, entry.method, entry.stat_code)
+    return stats
+
+
+def merge_host_stats(stats, partial):
+    for host, host_stats in partial.items():
+        if host in stats:
+            stats[host].merge(host_stats)
+        else:
+            stats[host] = host_stats
+    return stats
+
+
+def _aggregate_range(path, start, end):
+    return aggregate_hosts(file_reader.read_log_iter(parallel_reader.read_range(path, start, end)))
+
+
+def aggregate_hosts_parallel(path, workers=None):
+    stats = {}
+    for partial in parallel_reader.map_ranges(path, _aggregate_range, workers):
+        merge_host_stats(stats, partial)
+    return stats
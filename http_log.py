@@ -1,76 +1,687 @@
-import ipaddress
-import datetime
+import array
+import bz2
+import gzip
+import locale
+import lzma
+import operator
+import os
+import tempfile
+import time
+from collections import deque, namedtuple
+
+import log_cache
+import log_sources
+import parallel_reader
+from log_columns import ColumnStore
+from log_entry import HttpLogEntry, LazyHttpLogEntry, LogLineError, decode_fields
+from log_filter import as_where
+from log_groups import Grouping
+from log_index import HashIndex, Partition, SuffixIndex
+from log_metrics import LoadMetrics
+from log_query import Query
+from log_rollups import Rollups
+from log_sort import SortIndex
+from log_views import EntryView, readable
+from mapped_log import MappedEntries
+from time_index import TimeIndex
+
+LoadProgress = namedtuple('LoadProgress', ['rows', 'bytes_read', 'total_bytes'])
 
 
 class HttpLog:
-    def __init__(self, log_file):
+    def __init__(self, log_file, columnar=False, lazy=False, strict=False, workers=1, load=True,
+                 mmap=False, persist_index=False, cache=False, cache_dir=None, indexes=(), live=False,
+                 max_events=1000, profile=False, metrics_hooks=(), rollups=False):
         self.log_file = log_file
-        self.entries = []
-        self.events = []
-        self._load_entries()
+        self.columnar = columnar
+        self.lazy = lazy
+        self.strict = strict
+        self.workers = workers
+        self.mmap = mmap
+        self.persist_index = persist_index
+        self.cache = cache
+        self.cache_dir = cache_dir
+        self.live = live
+        self.profile = profile
+        self.entries = _new_storage(columnar)
+        self.events = deque(maxlen=max_events)
+        self.metrics = LoadMetrics(hooks=metrics_hooks)
+        self.loaded = False
+        self._time_index = None
+        self._sort_index = None
+        self._indexes = {}
+        self._partitions = {}
+        self._groupings = {}
+        self._rollups = None
+        self._listeners = []
+        self._offset = 0
+        self._file_id = None
+        # one uncompressed file is read by byte offset (mmap, ranges, follow); anything else goes file by file
+        self._single = not log_sources.is_pattern(log_file)
+        self._plain = self._single and not log_sources.is_compressed(log_file)
+        self._paths = []
+        # the cache holds columns for one file's offset, which other modes would silently ignore or replace
+        if cache and not (columnar and self._single):
+            raise ValueError("only a single columnar log can be cached")
+        if cache and mmap:
+            raise ValueError("a memory-mapped log cannot also be cached")
+        if load:
+            self._load_entries()
+            self.build_indexes(indexes)
+            if rollups:
+                self.rollups()
+
 
+    @classmethod
+    def from_loaded(cls, log_file, entries, events=(), metrics=None, **options):
+        # wraps rows parsed elsewhere (e.g. by _load_file in a worker process) as if this log had loaded them
+        log = cls(log_file, load=False, **options)
+        log.entries = _unpacked(entries)
+        log.events.extend(events)
+        if metrics is not None:
+            log.metrics.merge(metrics)
+        log.loaded = True
+        log._paths = log_sources.expand(log_file)
+        if log._plain:
+            log._file_id = _file_id(os.stat(log_file))
+            log._offset = log.metrics.bytes_read
+        return log
 
     def _load_entries(self):
         try:
-            with open(self.log_file, 'r') as f:
-                for line in f:
-                    try:
-                        entry = HttpLogEntry(line)
-                        self.entries.append(entry)
-                    except ValueError as e:
-                        self.events.append(f"Skipping line with error: {e}")
+            paths = log_sources.expand(self.log_file)
+            if self._single:
+                self._file_id = _file_id(os.stat(self.log_file))
+            if self.cache and self._load_cache():
+                self._paths = paths
+                self.loaded = True
+                self.metrics.publish()
+                return
+            if self.mmap and not self._plain:
+                raise ValueError("only a single uncompressed log file can be memory-mapped")
+            with self.metrics.timed('load'):
+                if self.mmap:
+                    self.entries = MappedEntries(self.log_file, self.lazy, self.strict, self.persist_index,
+                                                 on_row=self._mapped_row_read)
+                    # rows are only parsed when read, so they are counted as accepted or rejected then
+                    self.metrics.bytes_read = os.path.getsize(self.log_file)
+                    self.metrics.lines_read = len(self.entries)
+                elif self.workers > 1 and self._plain:
+                    self._load_parallel()
+                elif self.workers > 1 and len(paths) > 1:
+                    self._load_files_parallel(paths)
+                else:
+                    for path in paths:
+                        with log_sources.LogStream(path) as f:
+                            self._parse_lines(self._read_lines(f))
+            self._paths = paths
+
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File {self.log_file} not found.")
+
+        self.loaded = True
+        if self.cache:
+            self._save_cache()
+        self.metrics.publish()
+
+    def load_batches(self, batch_lines=5000):
+        # Parses the file in batches and yields a LoadProgress after each one; rows below progress.rows are
+        # complete and safe to read from another thread. Closing the generator early cancels the load.
+        try:
+            paths = log_sources.expand(self.log_file)
+            total_bytes = sum(map(os.path.getsize, paths))
+            if self._single:
+                self._file_id = _file_id(os.stat(self.log_file))
+            if self.cache and self._load_cache():
+                self._paths = paths
+                self.loaded = True
+                self._entries_appended()
+                self.metrics.publish()
+                yield LoadProgress(len(self.entries), total_bytes, total_bytes)
+                return
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File {self.log_file} not found.")
+
+        batch = []
+        done_bytes = 0
+        for path in paths:
+            with log_sources.LogStream(path) as f:
+                for line in self._read_lines(f):
+                    batch.append(line)
+                    if len(batch) >= batch_lines:
+                        yield self._load_batch(batch, done_bytes + f.position(), total_bytes)
+                        batch = []
+            done_bytes += os.path.getsize(path)
+            self._paths.append(path)
+        yield self._load_batch(batch, total_bytes, total_bytes)
+
+        self.loaded = True
+        if self.cache:
+            self._save_cache()
+
+    def _read_lines(self, f, hold_back=False):
+        # Advances self._offset past every line handed out. An unterminated last line is left for the next
+        # refresh when the writer may still be in the middle of it: always when reading what was appended,
+        # and on the first load of a live log.
+        hold_back = (hold_back or self.live) and self._plain
+        # bytes_read counts the same bytes as the offset, from wherever each of them started
+        start = self._offset - self.metrics.bytes_read
+        for line in _decode_lines(f, self.metrics, hold_back):
+            self._offset = start + self.metrics.bytes_read
+            yield line
+
+    def refresh(self):
+        if isinstance(self.entries, MappedEntries):
+            raise TypeError("a memory-mapped log cannot be refreshed")
+        if not self._plain:
+            return self._refresh_paths()
+
+        try:
+            stat = os.stat(self.log_file)
+        except FileNotFoundError:
+            # rotated away and not recreated yet
+            return EntryView(self.entries, range(0))
+
+        if _file_id(stat) != self._file_id or stat.st_size < self._offset:
+            # rotated or truncated: earlier rows are kept and the new file is read from its start
+            self._file_id = _file_id(stat)
+            self._offset = 0
+
+        start = len(self.entries)
+        if stat.st_size > self._offset:
+            with open(self.log_file, 'rb') as f:
+                f.seek(self._offset)
+                self._parse_lines(self._read_lines(f, hold_back=True))
+
+        return self._announce(start)
+
+    def _refresh_paths(self):
+        # compressed archives do not grow, but a pattern may match newly rotated files
+        try:
+            paths = log_sources.expand(self.log_file)
+        except FileNotFoundError:
+            paths = []
+
+        start = len(self.entries)
+        loaded = set(self._paths)
+        for path in paths:
+            if path not in loaded:
+                with log_sources.LogStream(path) as f:
+                    self._parse_lines(self._read_lines(f))
+                self._paths.append(path)
+        return self._announce(start)
+
+    def _announce(self, start):
+        new_entries = EntryView(self.entries, range(start, len(self.entries)))
+        if len(new_entries):
+            self._entries_appended()
+            self.metrics.publish()
+            for listener in list(self._listeners):
+                listener(new_entries)
+        return new_entries
+
+    def follow(self, interval=1.0):
+        while True:
+            new_entries = self.refresh()
+            if len(new_entries):
+                yield new_entries
+            else:
+                time.sleep(interval)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def _load_batch(self, lines, bytes_read, total_bytes):
+        self._parse_lines(lines)
+        self._entries_appended()
+        self.metrics.publish()
+        return LoadProgress(len(self.entries), bytes_read, total_bytes)
+
+    def epochs(self):
+        if isinstance(self.entries, ColumnStore):
+            return self.entries.ts
+        if isinstance(self.entries, MappedEntries):
+            return self.entries.epochs()
+
+        epochs = array.array('d', [float('nan')]) * len(self.entries)
+        for row, entry in readable(self.entries):
+            epochs[row] = entry.ts
+        return epochs
+
+    def time_index(self):
+        if self._time_index is None:
+            self._time_index = TimeIndex(self.epochs())
+        return self._time_index
+
+    def between(self, start=None, end=None):
+        return EntryView(self.entries, self.time_index().rows(start, end))
+
+    def rollups(self):
+        # built on first use, then kept up to date as rows are appended
+        if self._rollups is None or self._rollups.entries is not self.entries:
+            self._rollups = Rollups(self.entries, self.time_index)
+        self._rollups.update()
+        return self._rollups
+
+    def totals(self, start=None, end=None):
+        return self.rollups().totals(start, end)
+
+    def sort_index(self):
+        if self._sort_index is None:
+            self._sort_index = SortIndex(self.entries)
+        return self._sort_index
+
+    def sorted_by(self, *keys):
+        # keys are field names, '-field' for descending; permutations stay cached until rows are appended
+        return EntryView(self.entries, self.sort_index().permutation(*keys))
+
+    def index(self, field):
+        index = self._indexes.get(field)
+        if index is None:
+            index = SuffixIndex(field) if field == 'uri' else HashIndex(field)
+            index.update(self.entries)
+            self._indexes[field] = index
+        return index
+
+    def partition(self, key):
+        # kept up to date as rows are appended, like the indexes
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = Partition(key)
+            partition.update(self.entries)
+        return partition
+
+    def buckets(self, key):
+        return {value: EntryView(self.entries, rows) for value, rows in self.partition(key).rows.items()}
+
+    def grouping(self, *fields):
+        # e.g. grouping('uid') or grouping(*log_groups.CONNECTION_FIELDS); rebuilt after rows are appended
+        grouped = self._groupings.get(fields)
+        if grouped is None:
+            grouped = self._groupings[fields] = Grouping(self.entries, *fields)
+        return grouped
+
+    def built_index(self, field):
+        return self._indexes.get(field)
+
+    def build_indexes(self, fields):
+        for field in fields:
+            self.index(field)
+
+    def lookup(self, field, value):
+        return EntryView(self.entries, self.index(field).lookup(value))
+
+    def with_extension(self, extension):
+        return EntryView(self.entries, self.index('uri').lookup(extension))
+
+    def query(self):
+        return Query(self.entries, self)
+
+    def append_line(self, line):
+        if isinstance(self.entries, MappedEntries):
+            raise TypeError("entries cannot be appended to a memory-mapped log")
+
+        start = len(self.entries)
+        self._parse_lines([line])
+        if len(self.entries) > start:
+            self._entries_appended()
+
+    def _mapped_row_read(self, error, line):
+        if error is None:
+            self.metrics.rows_accepted += 1
+        else:
+            self.metrics.reject(error, line)
+            self.events.append(f"Skipping line with error: {error}")
+
+    def _parse_lines(self, lines):
+        _parse_lines(lines, self.entries, self.events, self.metrics, self.columnar, self.lazy, self.strict,
+                     self.profile)
+
+    def _entries_appended(self):
+        self._time_index = None
+        self._sort_index = None
+        for index in self._indexes.values():
+            index.update(self.entries)
+        for partition in self._partitions.values():
+            partition.update(self.entries)
+        self._groupings = {}
+        if self._rollups is not None:
+            self._rollups.update()
+
+    def _load_cache(self):
+        with self.metrics.timed('cache'):
+            cached = log_cache.load_cache(self.log_file, self.cache_dir)
+        if cached is None:
+            return False
+        self.entries = cached.store
+        self.events.extend(cached.events)
+        metrics = self.metrics
+        metrics.lines_read = cached.lines_read
+        metrics.rows_accepted = len(self.entries)
+        metrics.rows_rejected = cached.rows_rejected
+        metrics.rejects_by_reason.update(cached.rejects_by_reason)
+        metrics.rejects_by_column.update(cached.rejects_by_column)
+        self._offset = offset = cached.offset
+        if self._plain and os.path.getsize(self.log_file) > offset:
+            # rows appended after the cache was written (or while it was being loaded) are parsed now
+            with open(self.log_file, 'rb') as f:
+                f.seek(offset)
+                self._parse_lines(self._read_lines(f, hold_back=True))
+            self._save_cache()
+        return True
+
+    def _save_cache(self):
+        # a plain file is signed up to the bytes actually parsed; a compressed one is read whole
+        offset = self._offset if self._plain else os.path.getsize(self.log_file)
+        try:
+            log_cache.save_cache(self.log_file, self.entries, self.events, offset, self.metrics, self.cache_dir)
+        except OSError:
+            # a missing cache only costs a re-parse next time, so an unwritable location is not an error
+            pass
+
+    def invalidate_cache(self):
+        log_cache.invalidate(self.log_file, self.cache_dir)
+
+    def rebuild_cache(self):
+        self.invalidate_cache()
+        self.entries = _new_storage(self.columnar)
+        self.events = deque(maxlen=self.events.maxlen)
+        self.metrics = LoadMetrics(self.metrics.samples.maxlen, self.metrics.hooks)
+        self.loaded = False
+        self._time_index = None
+        self._sort_index = None
+        self._offset = 0
+        self._paths = []
+        fields = list(self._indexes)
+        self._indexes = {}
+        self._partitions = {}
+        self._groupings = {}
+        self._rollups = None
+        self._load_entries()
+        self.build_indexes(fields)
+
+    def iter_entries(self, where=None):
+        where = as_where(where)
 
+        if self.loaded:
+            for _, entry in readable(self.entries):
+                if where is None or where.match(entry):
+                    yield entry
+            return
+
+        try:
+            paths = log_sources.expand(self.log_file)
         except FileNotFoundError:
             raise FileNotFoundError(f"File {self.log_file} not found.")
 
+        # streaming skips malformed lines without recording them in events, which only a full load fills
+        for line in log_sources.iter_lines(paths):
+            parsed_line = line.strip().split('\t')
+            if where is not None and not where.match_fields(parsed_line):
+                continue
+            try:
+                if self.lazy:
+                    entry = LazyHttpLogEntry.from_fields(parsed_line, self.strict)
+                else:
+                    entry = HttpLogEntry.from_fields(parsed_line)
+                if where is None or where.match_decoded(entry):
+                    yield entry
+            except ValueError:
+                continue
+
+    def _load_parallel(self):
+        # Workers send back columns (or, for lazy entries, lines), and the parent builds the entry objects in
+        # one pass. That pass is serial, so columnar logs, which need no objects at all, scale best with workers.
+        size = parallel_reader.complete_size(self.log_file) if self.live else None
+        for entries, events, metrics in parallel_reader.map_ranges(self.log_file, _load_range, self.workers,
+                                                                   self.columnar, self.lazy, self.strict,
+                                                                   self.events.maxlen, self.profile, size=size):
+            self.entries.extend(_unpacked(entries))
+            self.events.extend(events)
+            self.metrics.merge(metrics)
+            # only the ranges split off when the load began were parsed; anything appended since is left to refresh
+            self._offset += metrics.bytes_read
+
+    def _load_files_parallel(self, paths):
+        for entries, events, metrics in parallel_reader.map_files(paths, _load_file, self.workers, self.columnar,
+                                                                  self.lazy, self.strict, self.events.maxlen,
+                                                                  self.profile):
+            self.entries.extend(_unpacked(entries))
+            self.events.extend(events)
+            self.metrics.merge(metrics)
+
+
+_ENTRY_VALUES = operator.attrgetter('ts', 'uid', 'id_orig_h', 'id_orig_p', 'id_resp_h', 'id_resp_p', 'method', 'host',
+                                    'uri', 'request_body_len', 'response_body_len', 'stat_code')
+
+
+class _PackedEntries:
+    # Entries as a worker process sends them back. Unpickling one object per row costs the parent more than
+    # parsing the row did, so eager entries travel as columns (plus the rare row whose values do not fit them)
+    # and lazy entries as their lines, which were already checked in the worker.
+    def __init__(self, entries, lazy):
+        self.lazy = lazy
+        if lazy:
+            # stripped lines hold no newline, so they travel as one string
+            self.lines = '\n'.join(entry._line for entry in entries)
+            self.count = len(entries)
+            return
+
+        self.store = ColumnStore()
+        self.odd = []
+        for row, entry in enumerate(entries):
+            try:
+                self.store.append_values(_ENTRY_VALUES(entry))
+            except LogLineError:
+                self.odd.append((row, entry))
+
+    def unpack(self):
+        if self.lazy:
+            return list(map(LazyHttpLogEntry.from_checked_line, self.lines.split('\n'))) if self.count else []
+
+        entries = list(map(HttpLogEntry.from_values, self.store.values()))
+        for row, entry in self.odd:
+            entries.insert(row, entry)
+        return entries
+
+
+def _packed(entries, columnar, lazy, strict):
+    # strict lazy entries were decoded when they were built, so they travel as eager entries do
+    return entries if columnar else _PackedEntries(entries, lazy and not strict)
+
+
+def _unpacked(entries):
+    return entries.unpack() if isinstance(entries, _PackedEntries) else entries
+
+
+def _file_id(stat):
+    return stat.st_dev, stat.st_ino
+
+
+def _new_storage(columnar):
+    return ColumnStore() if columnar else []
+
 
-class HttpLogEntry:
-    def __init__(self, line: str):
-        parsed_line = line.strip().split('\t')
+def _parse_lines(lines, entries, events, metrics, columnar, lazy, strict, profile=False):
+    if profile:
+        _parse_lines_profiled(lines, entries, events, metrics, columnar, lazy, strict)
+        return
 
+    start = len(entries)
+    with metrics.timed('parse'):
+        for line in lines:
+            metrics.lines_read += 1
+            try:
+                if columnar:
+                    entries.append_line(line)
+                elif lazy:
+                    entries.append(LazyHttpLogEntry(line, strict))
+                else:
+                    entries.append(HttpLogEntry(line))
+            except ValueError as e:
+                metrics.reject(e, line)
+                events.append(f"Skipping line with error: {e}")
+    metrics.rows_accepted += len(entries) - start
+
+
+def _parse_lines_profiled(lines, entries, events, metrics, columnar, lazy, strict):
+    # the same work as _parse_lines, with the clocks read between every step; lazy entries convert their
+    # fields inside the constructor, so for them conversion is counted as construction
+    clock = time.perf_counter
+    cpu_clock = time.thread_time
+    totals = {phase: [0.0, 0.0] for phase in ('io', 'split', 'convert', 'construct')}
+    start = len(entries)
+
+    def lap(phase, wall, cpu):
+        now, cpu_now = clock(), cpu_clock()
+        times = totals[phase]
+        times[0] += now - wall
+        times[1] += cpu_now - cpu
+        return now, cpu_now
+
+    wall, cpu = clock(), cpu_clock()
+    for line in lines:
+        wall, cpu = lap('io', wall, cpu)
+        metrics.lines_read += 1
+        fields = line.strip().split('\t')
+        wall, cpu = lap('split', wall, cpu)
+        phase = 'convert'
         try:
-            ts = float(parsed_line[0])
-            self.timestamp = datetime.datetime.fromtimestamp(ts)
-            self.uid = parsed_line[1]
-            self.id_orig_h = ipaddress.ip_address(parsed_line[2])
-            self.id_orig_p = int(parsed_line[3])
-            self.id_resp_h = ipaddress.ip_address(parsed_line[4])
-            self.id_resp_p = int(parsed_line[5])
-            self.method = parsed_line[7]
-            self.host = ipaddress.ip_address(parsed_line[8])
-            self.uri = parsed_line[9]
-            self.request_body_len = int(parsed_line[12])
-            self.response_body_len = int(parsed_line[13])
-            self.stat_code = int(parsed_line[14])
-
-        except (ValueError, IndexError) as e:
-            raise ValueError(f"Invalid log line format: {e}")
-
-    def __str__(self):
-        return (f"UID: {self.uid} Date: [{self.timestamp}] "
-                f"{self.id_orig_h}:{self.id_orig_p} -> {self.id_resp_h}:{self.id_resp_p} "
-                f"{self.method} {self.uri} "
-                f"ReqLen={self.request_body_len} RespLen={self.response_body_len} "
-                f"Status={self.stat_code}")
-
-    def to_dict(self):
-        return {
-            'ts': self.timestamp,
-            'uid': self.uid,
-            'id_orig_h': str(self.id_orig_h),
-            'id_orig_p': self.id_orig_p,
-            'id_resp_h': str(self.id_resp_h),
-            'id_resp_p': self.id_resp_p,
-            'method': self.method,
-            'host': str(self.host),
-            'uri': self.uri,
-            'request_body_len': self.request_body_len,
-            'response_body_len': self.response_body_len,
-            'stat_code': self.stat_code
-        }
-
-    def summary(self):
-        return f'{self.timestamp} {self.method} {self.uri}'
+            if lazy and not columnar:
+                phase = 'construct'
+                entries.append(LazyHttpLogEntry.from_fields(fields, strict))
+            else:
+                values = decode_fields(fields)
+                wall, cpu = lap('convert', wall, cpu)
+                phase = 'construct'
+                if columnar:
+                    entries.append_values(values)
+                else:
+                    entries.append(HttpLogEntry.from_values(values))
+        except ValueError as e:
+            metrics.reject(e, line)
+            events.append(f"Skipping line with error: {e}")
+        wall, cpu = lap(phase, wall, cpu)
+
+    for phase, (phase_wall, phase_cpu) in totals.items():
+        metrics.add_time(phase, phase_wall, phase_cpu)
+    metrics.rows_accepted += len(entries) - start
+
+
+def _load_range(log_file, start, end, columnar, lazy, strict, max_events=None, profile=False):
+    entries = _new_storage(columnar)
+    events = deque(maxlen=max_events)
+    metrics = LoadMetrics()
+    metrics.bytes_read = end - start
+    _parse_lines(parallel_reader.read_range(log_file, start, end), entries, events, metrics, columnar, lazy,
+                 strict, profile)
+    return _packed(entries, columnar, lazy, strict), list(events), metrics
+
+
+def _decode_lines(f, metrics, hold_back=False):
+    # counts each line in bytes_read before handing it out; with hold_back an unterminated last line is left unread
+    encoding = locale.getpreferredencoding(False)
+    for raw in f:
+        if hold_back and not raw.endswith(b'\n'):
+            break
+        metrics.bytes_read += len(raw)
+        yield raw.decode(encoding)
+
+
+def _load_file(path, columnar, lazy, strict, max_events=None, profile=False, live=False):
+    entries = _new_storage(columnar)
+    events = deque(maxlen=max_events)
+    metrics = LoadMetrics()
+    hold_back = live and not log_sources.is_compressed(path)
+    with log_sources.LogStream(path) as f:
+        _parse_lines(_decode_lines(f, metrics, hold_back), entries, events, metrics, columnar, lazy, strict,
+                     profile)
+    return _packed(entries, columnar, lazy, strict), list(events), metrics
+
+
+def test_refresh(path='http_first_100k.log'):
+    # a live log followed through a line written in two parts, a truncation and a rotation; after each refresh
+    # the rows match a parse of everything written so far
+    with open(path) as f:
+        lines = f.readlines()
+    third = len(lines) // 3
+    first, second = ''.join(lines[:third]), ''.join(lines[third:2 * third])
+    truncated, rotated = ''.join(lines[2 * third:2 * third + 100]), ''.join(lines[2 * third + 100:])
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_file = os.path.join(directory, 'http.log')
+        written = []
+
+        def write(text, mode='a'):
+            with open(log_file, mode) as f:
+                f.write(text)
+            written.append(text)
+
+        def check():
+            # rows from every complete line written so far
+            text = ''.join(written)
+            expected = ColumnStore.from_lines(text[:text.rfind('\n') + 1].splitlines(keepends=True))
+            assert bytes(log.entries.ts) == bytes(expected.ts)
+            assert log.entries.uri.values == expected.uri.values
+
+        write(first + second[:len(second) // 2], 'w')
+        log = HttpLog(log_file, columnar=True, live=True)
+        check()
+        write(second[len(second) // 2:])
+        log.refresh()
+        check()
+        # the same file, rewritten shorter than what was read: it is read again from its start
+        write(truncated, 'w')
+        log.refresh()
+        check()
+        # a new file in the old one's place
+        os.rename(log_file, log_file + '.1')
+        write(rotated, 'w')
+        log.refresh()
+        check()
+        print(f"rows: {len(log.entries)}")
+
+
+def test_compressed_and_globbed(path='http_first_100k.log'):
+    # the log cut into rotated parts, plain and compressed, read as a directory, a glob and one archive, and
+    # refreshed once another part appears; the rows always match a parse of the parts read, in name order
+    with open(path, 'rb') as f:
+        lines = f.readlines()
+    size = len(lines) // 5 + 1
+    chunks = [b''.join(lines[start:start + size]) for start in range(0, len(lines), size)]
+    writers = [('http.0.log', open), ('http.1.log.gz', gzip.open), ('http.2.log.bz2', bz2.open),
+               ('http.3.log.xz', lzma.open), ('http.4.log', open)]
+
+    def check(log, parts):
+        expected = ColumnStore.from_lines(b''.join(chunks[part] for part in parts).decode().splitlines(True))
+        assert len(log.entries) == len(expected)
+        assert [entry.ts for entry in log.entries] == list(expected.ts)
+        assert [entry.uid for entry in log.entries] == [entry.uid for entry in expected]
+
+    with tempfile.TemporaryDirectory() as directory:
+        def write(part):
+            name, opener = writers[part]
+            with opener(os.path.join(directory, name), 'wb') as f:
+                f.write(chunks[part])
+
+        for part in range(4):
+            write(part)
+        for source in (directory, os.path.join(directory, 'http.*.log*')):
+            for workers in (1, 2):
+                check(HttpLog(source, columnar=True, workers=workers), range(4))
+        check(HttpLog(directory, workers=2), range(4))
+        check(HttpLog(os.path.join(directory, 'http.1.log.gz'), columnar=True), [1])
+        assert sum(1 for _ in HttpLog(directory, load=False).iter_entries()) == len(HttpLog(directory).entries)
+
+        log = HttpLog(directory, columnar=True)
+        write(4)
+        assert len(log.refresh()) > 0
+        check(log, range(5))
+        print(f"rows: {len(log.entries)}")
+
 
 def main():
 
@@ -85,5 +696,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
-
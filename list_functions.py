@@ -1,13 +1,22 @@
 import ipaddress
+import operator
 from http import HTTPStatus
-from file_reader import log_first_100k
+from file_reader import LogRecord, log_first_100k
+from http_log import HttpLog
+from log_index import partition_views
+from log_query import as_query
+
+HTTP_STATUS_CODES = frozenset(status.value for status in HTTPStatus)
 
 def is_valid_http_status(code):
-    return code in {status.value for status in HTTPStatus}
+    return code in HTTP_STATUS_CODES
 
 def sort_log(log, index):
     try:
-        return sorted(log, key=lambda x: x[index])
+        if hasattr(log, 'sorted_by'):
+            # an HttpLog keeps the permutation, so sorting by the same key again costs nothing
+            return list(log.sorted_by(index if isinstance(index, str) else LogRecord._fields[index]))
+        return sorted(log, key=operator.itemgetter(index))
     except IndexError:
         print("Błąd: Podany indeks przekracza rozmiar krotek.")
         return log
@@ -27,7 +36,7 @@ def test_sort_log():
 def get_entries_by_addr(log, addr):
     try:
         addr_ip  = ipaddress.ip_address(addr)
-        return [entry for entry in log if entry[2] == addr_ip]
+        return as_query(log).src_in(addr_ip).all()
     except ValueError:
         print(f"{addr} is not a valid IP address.")
         return []
@@ -41,7 +50,7 @@ def test_get_entries_by_addr():
 
 def get_entries_by_code(log, stat_code):
     if is_valid_http_status(stat_code):
-        return [entry for entry in log if entry[9] == stat_code]
+        return as_query(log).status(stat_code).all()
 
     print(f'{stat_code} is not a valid HTTP code.')
     return []
@@ -53,8 +62,8 @@ def test_get_entries_by_code():
         print(entry)
 
 def get_failed_reads(log, combine=False):
-    l4 = [entry for entry in log if 99 < entry[9] < 1000 and int(entry[9]/100) == 4]
-    l5 = [entry for entry in log if 99 < entry[9] < 1000 and int(entry[9]/100)==5]
+    # one pass buckets every row by status class; on an HttpLog the buckets are kept for the next report
+    l4, l5 = partition_views(log, 'status_class', 4, 5)
     if combine:
         return l4+l5
     return l4, l5
@@ -72,7 +81,7 @@ def test_get_failed_reads():
             print(entry)
 
 def get_entries_by_extension(log, extension):
-    return [entry for entry in log if entry[8].endswith(extension)]
+    return as_query(log).extension(extension).all()
 
 def test_get_entries_by_extension():
     log_data = log_first_100k()
@@ -80,5 +89,19 @@ def test_get_entries_by_extension():
     for entry in filtered_log:
         print(entry)
 
+def test_indexed_lookups():
+    # an HttpLog answers through its indexes, built on the first lookup; the tuples are filtered row by row
+    log_data = log_first_100k()
+    addr = str(log_data[0].id_orig_h)
+    for log in (HttpLog('http_first_100k.log'), HttpLog('http_first_100k.log', lazy=True)):
+        for name, field, lookup in (('addr', 'id_orig_h', lambda log: get_entries_by_addr(log, addr)),
+                                    ('code', 'stat_code', lambda log: get_entries_by_code(log, 404)),
+                                    ('extension', 'uri', lambda log: get_entries_by_extension(log, '.jpg'))):
+            expected = [(record.ts, record.uid) for record in lookup(log_data)]
+            assert [(entry.ts, entry.uid) for entry in lookup(log)] == expected, name
+            assert log.built_index(field) is not None, name
+            assert [(entry.ts, entry.uid) for entry in lookup(log)] == expected, name
+            print(f"{name}: {len(expected)} rows")
+
 if __name__ == '__main__':
     test_get_entries_by_extension()
\ No newline at end of file
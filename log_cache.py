@@ -0,0 +1,202 @@
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from collections import Counter, namedtuple
+
+import log_intern
+from log_columns import ARRAY_COLUMNS, DICTIONARY_COLUMNS, ColumnStore, Dictionary
+from log_metrics import LoadMetrics
+
+CACHE_SUFFIX = '.hlcache'
+HASH_BLOCK = 1 << 20
+
+_CACHE_MAGIC = b'HLCACHE3'
+_CACHE_HEADER = struct.Struct('<8sQQ32sQQQ')
+_LENGTH = struct.Struct('<Q')
+
+CachedLog = namedtuple('CachedLog', ['store', 'events', 'offset', 'lines_read', 'rows_rejected', 'rejects_by_reason',
+                                     'rejects_by_column'])
+
+
+def cache_path(log_file, cache_dir=None):
+    if cache_dir is None:
+        return log_file + CACHE_SUFFIX
+    name = hashlib.blake2b(os.path.abspath(log_file).encode(), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, name + CACHE_SUFFIX)
+
+
+def content_hash(log_file, size=None):
+    # the first and last block of the file's first size bytes (by default the whole file) are hashed together
+    # with the size; a full hash would cost as much I/O as parsing
+    if size is None:
+        size = os.path.getsize(log_file)
+    digest = hashlib.blake2b(_LENGTH.pack(size), digest_size=32)
+
+    with open(log_file, 'rb') as f:
+        digest.update(f.read(min(HASH_BLOCK, size)))
+        if size > HASH_BLOCK:
+            f.seek(max(HASH_BLOCK, size - HASH_BLOCK))
+            digest.update(f.read(size - f.tell()))
+
+    return digest.digest()
+
+
+def _write_section(f, data):
+    f.write(_LENGTH.pack(len(data)))
+    f.write(data)
+    f.write(b'\0' * (-len(data) % 8))
+
+
+def _join_values(values):
+    # the count is stored first, so an empty list and a list holding one empty string stay distinct
+    return _LENGTH.pack(len(values)) + '\n'.join(map(str, values)).encode('utf-8')
+
+
+def _join_counts(counts):
+    return _join_values([f'{key}\t{count}' for key, count in counts.items()])
+
+
+def _split_counts(data):
+    return Counter({key: int(count) for key, count in (value.rsplit('\t', 1) for value in _split_values(data))})
+
+
+def save_cache(log_file, store, events, offset, metrics, cache_dir=None):
+    # offset is how many bytes of log_file the store was parsed from; rows appended while the log was loading
+    # lie beyond it, so they are neither signed nor marked as read. The load's line and reject counts are kept
+    # alongside the events, so a cached load reports the same metrics as the parse that wrote it.
+    path = cache_path(log_file, cache_dir)
+    mtime_ns = os.stat(log_file).st_mtime_ns
+    digest = content_hash(log_file, offset)
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'wb') as f:
+        f.write(_CACHE_HEADER.pack(_CACHE_MAGIC, offset, mtime_ns, digest, len(store), metrics.lines_read,
+                                   metrics.rows_rejected))
+        for name in ARRAY_COLUMNS:
+            _write_section(f, store.get_array(name).tobytes())
+        for name in DICTIONARY_COLUMNS:
+            _write_section(f, _join_values(getattr(store, name).values))
+        _write_section(f, _join_values(events))
+        _write_section(f, _join_counts(metrics.rejects_by_reason))
+        _write_section(f, _join_counts(metrics.rejects_by_column))
+
+    os.replace(tmp_path, path)
+
+
+def _split_values(data):
+    (count,) = _LENGTH.unpack_from(data)
+    return bytes(data[_LENGTH.size:]).decode('utf-8').split('\n') if count else []
+
+
+def _still_valid(log_file, offset, mtime_ns, digest):
+    # A log that only grew since the cache was written still starts with the cached bytes; one that kept its
+    # size must also keep its mtime.
+    stat = os.stat(log_file)
+    if stat.st_size < offset or (stat.st_size == offset and stat.st_mtime_ns != mtime_ns):
+        return False
+    return content_hash(log_file, offset) == digest
+
+
+def load_cache(log_file, cache_dir=None):
+    # a CachedLog or None; rows past offset were appended after the cache was written
+    try:
+        f = open(cache_path(log_file, cache_dir), 'rb')
+    except FileNotFoundError:
+        return None
+
+    with f:
+        header = f.read(_CACHE_HEADER.size)
+        if len(header) < _CACHE_HEADER.size:
+            return None
+        magic, offset, mtime_ns, digest, rows, lines_read, rows_rejected = _CACHE_HEADER.unpack(header)
+        if magic != _CACHE_MAGIC or not _still_valid(log_file, offset, mtime_ns, digest):
+            return None
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(data)
+    pos = _CACHE_HEADER.size
+    store = ColumnStore()
+
+    def next_section():
+        nonlocal pos
+        (length,) = _LENGTH.unpack_from(data, pos)
+        pos += _LENGTH.size
+        section = view[pos:pos + length]
+        pos += length + (-length % 8)
+        return section
+
+    try:
+        for name in ARRAY_COLUMNS:
+            typecode = store.get_array(name).typecode
+            # arrays stay memory-mapped; ColumnStore copies them only if rows are appended later
+            store.set_array(name, next_section().cast(typecode))
+        for name in DICTIONARY_COLUMNS:
+            values = _split_values(next_section())
+            if name == 'host':
+                values = [log_intern.address(value) for value in values]
+            setattr(store, name, Dictionary(values))
+        events = _split_values(next_section())
+        rejects_by_reason = _split_counts(next_section())
+        rejects_by_column = _split_counts(next_section())
+    except (struct.error, TypeError, UnicodeDecodeError, ValueError):
+        return None
+
+    if len(store) != rows:
+        return None
+    return CachedLog(store, events, offset, lines_read, rows_rejected, rejects_by_reason, rejects_by_column)
+
+
+def invalidate(log_file, cache_dir=None):
+    try:
+        os.remove(cache_path(log_file, cache_dir))
+    except FileNotFoundError:
+        pass
+
+
+def test_cache_round_trip(path='http_first_100k.log'):
+    # a store parsed from the first half of the log against the same store written to a cache and mapped back;
+    # then the cache of that file once the rest is appended, and once its first line is edited
+    with open(path, 'rb') as f:
+        data = f.read()
+    half = data.index(b'\n', len(data) // 2) + 1
+    lines = data[:half].decode().splitlines(keepends=True)
+
+    events = []
+    metrics = LoadMetrics()
+    metrics.lines_read = len(lines)
+
+    def reject(error, line):
+        metrics.reject(error, line)
+        events.append(f"Skipping line with error: {error}")
+
+    store = ColumnStore.from_lines(lines, reject)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        log_file = os.path.join(cache_dir, 'http.log')
+        with open(log_file, 'wb') as f:
+            f.write(data[:half])
+        save_cache(log_file, store, events, half, metrics, cache_dir)
+
+        cached = load_cache(log_file, cache_dir)
+        assert all(bytes(cached.store.get_array(name)) == bytes(store.get_array(name)) for name in ARRAY_COLUMNS)
+        assert all(getattr(cached.store, name).values == getattr(store, name).values for name in DICTIONARY_COLUMNS)
+        assert list(map(str, cached.store)) == list(map(str, store))
+        assert cached.events == events and cached.offset == half
+        assert (cached.lines_read, cached.rows_rejected, cached.rejects_by_reason, cached.rejects_by_column) == (
+            metrics.lines_read, metrics.rows_rejected, metrics.rejects_by_reason, metrics.rejects_by_column)
+        # the mapped cache file is released before it is replaced or its directory removed
+        del cached
+
+        # appended rows leave the cached rows valid, and the load goes on from the cached offset
+        with open(log_file, 'ab') as f:
+            f.write(data[half:])
+        cached = load_cache(log_file, cache_dir)
+        assert cached is not None and cached.offset == half and len(cached.store) == len(store)
+        del cached
+
+        with open(log_file, 'r+b') as f:
+            f.write(b'X')
+        assert load_cache(log_file, cache_dir) is None
+        print(f"rows: {len(store)}, rejected: {metrics.rows_rejected}")
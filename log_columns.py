@@ -0,0 +1,287 @@
+import array
+import ipaddress
+
+from log_entry import BaseLogEntry, LogLineError, check_ts, decode_fields
+
+_LOW64 = (1 << 64) - 1
+_V4_MAPPED = 0xffff << 32
+
+ARRAY_COLUMNS = ['ts', 'uid_codes', 'id_orig_h.hi', 'id_orig_h.lo', 'id_orig_p', 'id_resp_h.hi', 'id_resp_h.lo',
+                 'id_resp_p', 'method_codes', 'host_codes', 'uri_codes', 'request_body_len', 'response_body_len',
+                 'stat_code']
+DICTIONARY_COLUMNS = ['uid', 'method', 'host', 'uri']
+
+
+def encode_ip(addr):
+    # IPv4 is kept as an IPv4-mapped IPv6 address so both versions fit the same two uint64 columns
+    value = int(addr)
+    if addr.version == 4:
+        value |= _V4_MAPPED
+    return value >> 64, value & _LOW64
+
+
+def decode_ip(hi, lo):
+    if hi == 0 and lo >> 32 == 0xffff:
+        return ipaddress.IPv4Address(lo & 0xffffffff)
+    return ipaddress.IPv6Address(hi << 64 | lo)
+
+
+class Dictionary:
+    def __init__(self, values=None):
+        self.values = list(values) if values else []
+        self._codes = None
+
+    @property
+    def codes(self):
+        # built on first lookup, so a dictionary restored from a cache costs nothing until it is searched
+        if self._codes is None:
+            self._codes = {value: code for code, value in enumerate(self.values)}
+        return self._codes
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def code_of(self, value):
+        return self.codes.get(value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class IpColumn:
+    def __init__(self):
+        self.hi = array.array('Q')
+        self.lo = array.array('Q')
+
+    def append(self, addr):
+        hi, lo = encode_ip(addr)
+        self.hi.append(hi)
+        self.lo.append(lo)
+
+    def __getitem__(self, row):
+        return decode_ip(self.hi[row], self.lo[row])
+
+    def __len__(self):
+        return len(self.lo)
+
+
+class HttpLogRow(BaseLogEntry):
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def ts(self):
+        return self._store.ts[self._row]
+
+    @property
+    def uid(self):
+        return self._store.uid.values[self._store.uid_codes[self._row]]
+
+    @property
+    def id_orig_h(self):
+        return self._store.id_orig_h[self._row]
+
+    @property
+    def id_orig_p(self):
+        return self._store.id_orig_p[self._row]
+
+    @property
+    def id_resp_h(self):
+        return self._store.id_resp_h[self._row]
+
+    @property
+    def id_resp_p(self):
+        return self._store.id_resp_p[self._row]
+
+    @property
+    def method(self):
+        return self._store.method.values[self._store.method_codes[self._row]]
+
+    @property
+    def host(self):
+        return self._store.host.values[self._store.host_codes[self._row]]
+
+    @property
+    def uri(self):
+        return self._store.uri.values[self._store.uri_codes[self._row]]
+
+    @property
+    def request_body_len(self):
+        return self._store.request_body_len[self._row]
+
+    @property
+    def response_body_len(self):
+        return self._store.response_body_len[self._row]
+
+    @property
+    def stat_code(self):
+        return self._store.stat_code[self._row]
+
+    def __eq__(self, other):
+        return isinstance(other, HttpLogRow) and self._store is other._store and self._row == other._row
+
+    def __hash__(self):
+        return hash((id(self._store), self._row))
+
+
+class ColumnStore:
+    def __init__(self):
+        self.ts = array.array('d')
+        self.uid = Dictionary()
+        self.uid_codes = array.array('I')
+        self.id_orig_h = IpColumn()
+        self.id_orig_p = array.array('H')
+        self.id_resp_h = IpColumn()
+        self.id_resp_p = array.array('H')
+        self.method = Dictionary()
+        self.method_codes = array.array('I')
+        self.host = Dictionary()
+        self.host_codes = array.array('I')
+        self.uri = Dictionary()
+        self.uri_codes = array.array('I')
+        self.request_body_len = array.array('Q')
+        self.response_body_len = array.array('Q')
+        self.stat_code = array.array('H')
+        self._writable = True
+
+    @classmethod
+    def from_lines(cls, lines, on_reject=None):
+        # a store of the lines that parse; on_reject(error, line) is called for each of the others
+        store = cls()
+        for line in lines:
+            try:
+                store.append_line(line)
+            except ValueError as e:
+                if on_reject is not None:
+                    on_reject(e, line)
+        return store
+
+    def get_array(self, name):
+        owner, _, attr = name.rpartition('.')
+        return getattr(getattr(self, owner) if owner else self, attr)
+
+    def set_array(self, name, values):
+        owner, _, attr = name.rpartition('.')
+        setattr(getattr(self, owner) if owner else self, attr, values)
+        # read-only buffers (e.g. memoryviews over a cache file) are copied into arrays before the next write
+        if not isinstance(values, array.array):
+            self._writable = False
+
+    def _make_writable(self):
+        for name in ARRAY_COLUMNS:
+            values = self.get_array(name)
+            if not isinstance(values, array.array):
+                self.set_array(name, array.array(values.format, values))
+        self._writable = True
+
+    def append_line(self, line):
+        self.append_values(decode_fields(line.strip().split('\t')))
+
+    def append_values(self, values):
+        (ts, uid, id_orig_h, id_orig_p, id_resp_h, id_resp_p, method, host, uri,
+         request_body_len, response_body_len, stat_code) = values
+
+        # range check up front, so a bad value cannot leave the columns with different lengths
+        check_ts(ts)
+        for column, value, limit in (('id_orig_p', id_orig_p, 65536), ('id_resp_p', id_resp_p, 65536),
+                                     ('stat_code', stat_code, 65536), ('request_body_len', request_body_len, 1 << 64),
+                                     ('response_body_len', response_body_len, 1 << 64)):
+            if not 0 <= value < limit:
+                raise LogLineError(f"Invalid log line format: {column} {value} out of range", column, 'out of range')
+
+        if not self._writable:
+            self._make_writable()
+        self.ts.append(ts)
+        self.uid_codes.append(self.uid.encode(uid))
+        self.id_orig_h.append(id_orig_h)
+        self.id_orig_p.append(id_orig_p)
+        self.id_resp_h.append(id_resp_h)
+        self.id_resp_p.append(id_resp_p)
+        self.method_codes.append(self.method.encode(method))
+        self.host_codes.append(self.host.encode(host))
+        self.uri_codes.append(self.uri.encode(uri))
+        self.request_body_len.append(request_body_len)
+        self.response_body_len.append(response_body_len)
+        self.stat_code.append(stat_code)
+
+    def extend(self, other):
+        if not self._writable:
+            self._make_writable()
+        self.ts.extend(other.ts)
+        self.id_orig_h.hi.extend(other.id_orig_h.hi)
+        self.id_orig_h.lo.extend(other.id_orig_h.lo)
+        self.id_orig_p.extend(other.id_orig_p)
+        self.id_resp_h.hi.extend(other.id_resp_h.hi)
+        self.id_resp_h.lo.extend(other.id_resp_h.lo)
+        self.id_resp_p.extend(other.id_resp_p)
+        self.request_body_len.extend(other.request_body_len)
+        self.response_body_len.extend(other.response_body_len)
+        self.stat_code.extend(other.stat_code)
+
+        for name in ('uid', 'method', 'host', 'uri'):
+            ours, theirs = getattr(self, name), getattr(other, name)
+            remap = [ours.encode(value) for value in theirs.values]
+            getattr(self, name + '_codes').extend(remap[code] for code in getattr(other, name + '_codes'))
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [HttpLogRow(self, row) for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        return HttpLogRow(self, index)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield HttpLogRow(self, row)
+
+    def column_values(self, field, start=0):
+        if field in DICTIONARY_COLUMNS:
+            values = getattr(self, field).values
+            return (values[code] for code in self.get_array(field + '_codes')[start:])
+
+        column = getattr(self, field)
+        if isinstance(column, IpColumn):
+            return self._ip_values(column, start)
+        return iter(column[start:])
+
+    def values(self):
+        # rows as the tuples decode_fields returns; each distinct address is decoded once
+        decoded = {}
+
+        def addresses(column):
+            for key in zip(column.hi, column.lo):
+                addr = decoded.get(key)
+                if addr is None:
+                    addr = decoded[key] = decode_ip(*key)
+                yield addr
+
+        def strings(field):
+            return map(getattr(self, field).values.__getitem__, self.get_array(field + '_codes'))
+
+        return zip(self.ts, strings('uid'), addresses(self.id_orig_h), self.id_orig_p, addresses(self.id_resp_h),
+                   self.id_resp_p, strings('method'), strings('host'), strings('uri'), self.request_body_len,
+                   self.response_body_len, self.stat_code)
+
+    def _ip_values(self, column, start):
+        decoded = {}
+        for hi, lo in zip(column.hi[start:], column.lo[start:]):
+            addr = decoded.get((hi, lo))
+            if addr is None:
+                addr = decoded[(hi, lo)] = decode_ip(hi, lo)
+            yield addr
+
+    def nbytes(self):
+        return sum(len(a) * a.itemsize for a in map(self.get_array, ARRAY_COLUMNS))
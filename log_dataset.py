@@ -0,0 +1,196 @@
+import bisect
+import heapq
+import itertools
+import operator
+import os
+import tempfile
+
+import log_sources
+import parallel_reader
+from http_log import HttpLog, _load_file
+from log_metrics import LoadMetrics
+from log_rollups import COLUMNS
+from time_index import to_epoch
+
+_ts = operator.attrgetter('ts')
+
+
+class Shard:
+    __slots__ = ('path', 'log', 'min_ts', 'max_ts')
+
+    def __init__(self, path, log):
+        self.path = path
+        self.log = log
+        self.update_bounds()
+
+    def update_bounds(self):
+        time_index = self.log.time_index()
+        self.min_ts = time_index.min()
+        self.max_ts = time_index.max()
+
+    def overlaps(self, start=None, end=None):
+        # start and end are epochs or None; a shard without readable timestamps overlaps nothing
+        if self.min_ts is None:
+            return False
+        return (start is None or self.max_ts >= start) and (end is None or self.min_ts <= end)
+
+
+def _merge_totals(total, part):
+    for column, value in part.items():
+        if column == 'methods':
+            methods = total['methods']
+            for method, count in value.items():
+                methods[method] = methods.get(method, 0) + count
+        else:
+            total[column] += value
+    return total
+
+
+class LogDataset:
+    # One logical log over many Zeek http logs (a directory, a glob or a single file), one HttpLog per file.
+    # Files are parsed in parallel processes. Every shard keeps its first and last timestamp, so time-range
+    # reads never touch shards outside the range, and time order comes from a k-way merge of the shards' own
+    # time indexes rather than from sorting all rows. With live=True an unterminated last line of a file that is
+    # still being written is left for refresh(), as in a live HttpLog.
+    def __init__(self, path, workers=None, columnar=True, lazy=False, strict=False, max_events=1000, live=False):
+        self.path = path
+        self.options = dict(columnar=columnar, lazy=lazy, strict=strict, max_events=max_events, live=live)
+        self.shards = [Shard(shard_path, log) for shard_path, log in self._load(log_sources.expand(path), workers)]
+        self._update_offsets()
+
+    def _load(self, paths, workers):
+        if len(paths) == 1 or workers == 1:
+            return [(path, HttpLog(path, **self.options)) for path in paths]
+
+        options = self.options
+        loaded = parallel_reader.map_files(paths, _load_file, workers, options['columnar'], options['lazy'],
+                                           options['strict'], options['max_events'], False, options['live'])
+        return [(path, HttpLog.from_loaded(path, entries, events, metrics, **options))
+                for path, (entries, events, metrics) in zip(paths, loaded)]
+
+    def _update_offsets(self):
+        self._offsets = list(itertools.accumulate((len(shard.log.entries) for shard in self.shards), initial=0))
+
+    def refresh(self):
+        # picks up files that appeared since loading (e.g. the next hour's log) and rows appended to known ones
+        known = {shard.path for shard in self.shards}
+        try:
+            paths = log_sources.expand(self.path)
+        except FileNotFoundError:
+            paths = []
+
+        new_rows = 0
+        for shard in self.shards:
+            # compressed files are finished archives; only plain ones can still grow
+            if not log_sources.is_compressed(shard.path):
+                added = len(shard.log.refresh())
+                if added:
+                    shard.update_bounds()
+                    new_rows += added
+        for path in paths:
+            if path not in known:
+                # a file that appeared since the last look is most likely still being written
+                shard = Shard(path, HttpLog(path, **dict(self.options, live=True)))
+                self.shards.append(shard)
+                new_rows += len(shard.log.entries)
+        self._update_offsets()
+        return new_rows
+
+    def __len__(self):
+        return self._offsets[-1]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        shard = bisect.bisect_right(self._offsets, index) - 1
+        return self.shards[shard].log.entries[index - self._offsets[shard]]
+
+    def __iter__(self):
+        # file order; use time_ordered() for time order
+        for shard in self.shards:
+            yield from shard.log.entries
+
+    @property
+    def metrics(self):
+        metrics = LoadMetrics()
+        for shard in self.shards:
+            metrics.merge(shard.log.metrics)
+        return metrics
+
+    @property
+    def events(self):
+        return list(itertools.chain.from_iterable(shard.log.events for shard in self.shards))
+
+    def min(self):
+        return min((shard.min_ts for shard in self.shards if shard.min_ts is not None), default=None)
+
+    def max(self):
+        return max((shard.max_ts for shard in self.shards if shard.max_ts is not None), default=None)
+
+    def shards_between(self, start=None, end=None):
+        start = None if start is None else to_epoch(start)
+        end = None if end is None else to_epoch(end)
+        return [shard for shard in self.shards if shard.overlaps(start, end)]
+
+    def time_ordered(self, start=None, end=None):
+        # Shards whose time ranges overlap are merged through a heap; runs of shards that follow each other
+        # (the usual case for hourly files) are simply chained.
+        shards = sorted(self.shards_between(start, end), key=operator.attrgetter('min_ts'))
+        group = []
+        group_end = None
+        for shard in shards:
+            if group and shard.min_ts > group_end:
+                yield from self._merge(group, start, end)
+                group = []
+            group_end = shard.max_ts if not group else max(group_end, shard.max_ts)
+            group.append(shard)
+        yield from self._merge(group, start, end)
+
+    @staticmethod
+    def _merge(shards, start, end):
+        views = [shard.log.between(start, end) for shard in shards]
+        if len(views) == 1:
+            return iter(views[0])
+        return heapq.merge(*views, key=_ts)
+
+    def between(self, start=None, end=None):
+        return list(self.time_ordered(start, end))
+
+    def totals(self, start=None, end=None):
+        # from each overlapping shard's rollups
+        total = dict.fromkeys(COLUMNS, 0)
+        total['methods'] = {}
+        for shard in self.shards_between(start, end):
+            _merge_totals(total, shard.log.totals(start, end))
+        return total
+
+
+def test_time_ordered(path='http_first_100k.log', shards=3):
+    # the log dealt round-robin into overlapping shards, merged back, against the single file sorted by time;
+    # each shard is loaded while cut off in the middle of a line and completed before a refresh
+    with open(path) as f:
+        lines = f.readlines()
+    with tempfile.TemporaryDirectory() as directory:
+        rests = []
+        for shard in range(shards):
+            text = ''.join(lines[shard::shards])
+            shard_path = os.path.join(directory, f'http.{shard}.log')
+            with open(shard_path, 'w') as f:
+                f.write(text[:len(text) // 2])
+            rests.append((shard_path, text[len(text) // 2:]))
+        dataset = LogDataset(directory, workers=2, live=True)
+        for shard_path, rest in rests:
+            with open(shard_path, 'a') as f:
+                f.write(rest)
+        dataset.refresh()
+        log = HttpLog(path, columnar=True)
+
+        assert len(dataset) == len(log.entries)
+        epochs = sorted(log.entries.ts)
+        assert [entry.ts for entry in dataset.time_ordered()] == epochs
+        start, end = epochs[len(epochs) // 4] + 0.5, epochs[len(epochs) // 2]
+        assert [entry.ts for entry in dataset.between(start, end)] == [ts for ts in epochs if start <= ts <= end]
+        assert dataset.totals(start, end) == log.totals(start, end)
+        print(f"rows: {len(dataset)}")
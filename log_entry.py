@@ -0,0 +1,189 @@
+import datetime
+
+import log_intern
+
+
+class BaseLogEntry:
+    __slots__ = ()
+
+    @property
+    def timestamp(self):
+        # entries keep the epoch; a datetime is only built when one is displayed or asked for
+        return datetime.datetime.fromtimestamp(self.ts)
+
+    def __str__(self):
+        return (f"UID: {self.uid} Date: [{self.timestamp}] "
+                f"{self.id_orig_h}:{self.id_orig_p} -> {self.id_resp_h}:{self.id_resp_p} "
+                f"{self.method} {self.uri} "
+                f"ReqLen={self.request_body_len} RespLen={self.response_body_len} "
+                f"Status={self.stat_code}")
+
+    def to_dict(self):
+        return {
+            'ts': self.timestamp,
+            'uid': self.uid,
+            'id_orig_h': str(self.id_orig_h),
+            'id_orig_p': self.id_orig_p,
+            'id_resp_h': str(self.id_resp_h),
+            'id_resp_p': self.id_resp_p,
+            'method': self.method,
+            'host': str(self.host),
+            'uri': self.uri,
+            'request_body_len': self.request_body_len,
+            'response_body_len': self.response_body_len,
+            'stat_code': self.stat_code
+        }
+
+    def summary(self):
+        return f'{self.timestamp} {self.method} {self.uri}'
+
+    def check(self):
+        # returns the entry once all its fields decode, raising LogLineError otherwise
+        return self
+
+    def _assign(self, values):
+        (self.ts, self.uid, self.id_orig_h, self.id_orig_p, self.id_resp_h, self.id_resp_p, self.method,
+         self.host, self.uri, self.request_body_len, self.response_body_len, self.stat_code) = values
+
+
+_ADDRESS_COLUMNS = ('id_orig_h', 'id_resp_h', 'host')
+
+
+class LogLineError(ValueError):
+    def __init__(self, message, column=None, reason=None):
+        super().__init__(message)
+        self.column = column
+        self.reason = reason
+
+
+def _line_error(e, column):
+    if isinstance(e, IndexError):
+        reason = 'missing field'
+    elif column in _ADDRESS_COLUMNS:
+        reason = 'invalid address'
+    else:
+        reason = 'invalid number'
+    return LogLineError(f"Invalid log line format: {e}", column, reason)
+
+
+# a day inside datetime's range at either end, so the local-time conversion cannot overflow
+_MIN_TS = datetime.datetime(1, 1, 2, tzinfo=datetime.timezone.utc).timestamp()
+_MAX_TS = datetime.datetime(9999, 12, 30, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def check_ts(ts):
+    # float() also takes nan, inf and epochs no datetime can show; such a row could never be displayed
+    if not _MIN_TS <= ts <= _MAX_TS:
+        raise LogLineError(f"Invalid log line format: ts {ts} out of range", 'ts', 'out of range')
+    return ts
+
+
+def decode_ts(text):
+    return check_ts(float(text))
+
+
+def decode_fields(parsed_line):
+    column = None
+    try:
+        column = 'ts'
+        ts = decode_ts(parsed_line[0])
+        column = 'uid'
+        uid = log_intern.string(parsed_line[1])
+        column = 'id_orig_h'
+        id_orig_h = log_intern.address(parsed_line[2])
+        column = 'id_orig_p'
+        id_orig_p = int(parsed_line[3])
+        column = 'id_resp_h'
+        id_resp_h = log_intern.address(parsed_line[4])
+        column = 'id_resp_p'
+        id_resp_p = int(parsed_line[5])
+        column = 'method'
+        method = log_intern.string(parsed_line[7])
+        column = 'host'
+        host = log_intern.address(parsed_line[8])
+        column = 'uri'
+        uri = log_intern.string(parsed_line[9])
+        column = 'request_body_len'
+        request_body_len = int(parsed_line[12])
+        column = 'response_body_len'
+        response_body_len = int(parsed_line[13])
+        column = 'stat_code'
+        stat_code = int(parsed_line[14])
+
+    except LogLineError:
+        raise
+    except (ValueError, IndexError) as e:
+        raise _line_error(e, column)
+
+    return (ts, uid, id_orig_h, id_orig_p, id_resp_h, id_resp_p, method, host, uri,
+            request_body_len, response_body_len, stat_code)
+
+
+class HttpLogEntry(BaseLogEntry):
+    def __init__(self, line: str):
+        self._assign(decode_fields(line.strip().split('\t')))
+
+    @classmethod
+    def from_fields(cls, parsed_line):
+        return cls.from_values(decode_fields(parsed_line))
+
+    @classmethod
+    def from_values(cls, values):
+        entry = cls.__new__(cls)
+        entry._assign(values)
+        return entry
+
+
+_FIELDS = frozenset(('ts', 'uid', 'id_orig_h', 'id_orig_p', 'id_resp_h', 'id_resp_p', 'method', 'host', 'uri',
+                     'request_body_len', 'response_body_len', 'stat_code'))
+
+
+class LazyHttpLogEntry(BaseLogEntry):
+    # Keeps the raw line, one string instead of a string per field, and decodes the whole row on first read.
+    # Without strict a malformed row is only reported (as LogLineError) when it is read or checked.
+    __slots__ = ('_line', 'ts', 'uid', 'id_orig_h', 'id_orig_p', 'id_resp_h', 'id_resp_p', 'method', 'host', 'uri',
+                 'request_body_len', 'response_body_len', 'stat_code')
+
+    def __init__(self, line: str, strict=False):
+        self._init_line(line.strip(), strict)
+
+    @classmethod
+    def from_fields(cls, fields, strict=False):
+        # only the 15 columns that are read are kept
+        entry = cls.__new__(cls)
+        entry._init_line('\t'.join(fields[:15]), strict)
+        return entry
+
+    @classmethod
+    def from_checked_line(cls, line):
+        # for a stripped line that has already passed _init_line, e.g. in a worker process
+        entry = cls.__new__(cls)
+        entry._line = line
+        return entry
+
+    def _init_line(self, line, strict):
+        self._line = line
+
+        columns = line.count('\t') + 1
+        if columns < 15:
+            raise LogLineError(f"Invalid log line format: expected at least 15 fields, got {columns}",
+                               reason='missing field')
+        if line.startswith('#'):
+            header = line.partition('\t')[0]
+            raise LogLineError(f"Invalid log line format: header line {header}", 'ts', 'header line')
+
+        if strict:
+            self.check()
+
+    def check(self):
+        if self._line is not None:
+            self._assign(decode_fields(self._line.split('\t')))
+            self._line = None
+        return self
+
+    def __getattr__(self, name):
+        # only reached for fields not decoded yet; a row that fails raises again on every read
+        if name not in _FIELDS:
+            raise AttributeError(name)
+        self.check()
+        return getattr(self, name)
@@ -0,0 +1,325 @@
+import array
+import csv
+import gzip
+import json
+import os
+import tempfile
+from itertools import islice
+
+from http_log import HttpLog
+from log_columns import DICTIONARY_COLUMNS, ColumnStore, IpColumn, decode_ip
+from log_query import Query
+from log_views import EntryView, readable
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FIELDS = ('ts', 'uid', 'id_orig_h', 'id_orig_p', 'id_resp_h', 'id_resp_p', 'method', 'host', 'uri',
+          'request_body_len', 'response_body_len', 'stat_code')
+CHUNK_ROWS = 1 << 16
+_NUMERIC_FIELDS = frozenset(('ts', 'id_orig_p', 'id_resp_p', 'request_body_len', 'response_body_len', 'stat_code'))
+
+
+class _Coded:
+    # a chunk of a column as codes into values; values only ever grow, so encodings can be cached per field
+    __slots__ = ('codes', 'values')
+
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+
+def _typecode(column):
+    return getattr(column, 'typecode', None) or column.format
+
+
+class _StoreChunks:
+    # Column slices of a ColumnStore. A contiguous run of rows is sliced from the arrays; anything else is
+    # gathered a column at a time. Addresses become codes into a table of the distinct addresses seen so far.
+    def __init__(self, store):
+        self.store = store
+        self.addresses = []
+        self._address_codes = {}
+
+    def take(self, column, rows):
+        if isinstance(rows, range) and rows.step == 1:
+            return column[rows.start:rows.stop]
+        return array.array(_typecode(column), map(column.__getitem__, rows))
+
+    def chunk(self, rows):
+        store = self.store
+        columns = {}
+        for field in FIELDS:
+            if field in DICTIONARY_COLUMNS:
+                codes = self.take(store.get_array(field + '_codes'), rows)
+                columns[field] = _Coded(codes, getattr(store, field).values)
+                continue
+            column = getattr(store, field)
+            if isinstance(column, IpColumn):
+                columns[field] = _Coded(self._address_chunk(self.take(column.hi, rows), self.take(column.lo, rows)),
+                                        self.addresses)
+            else:
+                columns[field] = self.take(column, rows)
+        return columns
+
+    def _address_chunk(self, his, los):
+        codes = array.array('I')
+        known = self._address_codes
+        for key in zip(his, los):
+            code = known.get(key)
+            if code is None:
+                code = known[key] = len(self.addresses)
+                self.addresses.append(decode_ip(*key))
+            codes.append(code)
+        return codes
+
+
+def _entry_chunk(entries):
+    columns = {field: [] for field in FIELDS}
+    appends = [columns[field].append for field in FIELDS]
+    for entry in entries:
+        for append, field in zip(appends, FIELDS):
+            append(getattr(entry, field, None))
+    return columns
+
+
+def _row_chunks(rows, chunk_rows):
+    if isinstance(rows, range):
+        for start in range(0, len(rows), chunk_rows):
+            yield rows[start:start + chunk_rows]
+        return
+    rows = iter(rows)
+    while True:
+        chunk = array.array('Q', islice(rows, chunk_rows))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _chunks(source, chunk_rows):
+    # column chunks of at most chunk_rows rows from a query, view, HttpLog, LogDataset or entry sequence
+    shards = getattr(source, 'shards', None)
+    if shards is not None:
+        for shard in shards:
+            yield from _chunks(shard.log, chunk_rows)
+        return
+
+    if isinstance(source, Query):
+        entries, rows = source.entries, source.rows()
+    elif isinstance(source, EntryView):
+        entries, rows = source.entries, source.rows
+    elif isinstance(source, ColumnStore) or not hasattr(source, 'entries'):
+        entries, rows = source, None
+    else:
+        entries, rows = source.entries, None
+
+    if rows is None:
+        if not hasattr(entries, '__getitem__'):
+            # a plain iterable of entries
+            entries = iter(entries)
+            while True:
+                batch = list(islice(entries, chunk_rows))
+                if not batch:
+                    return
+                yield _entry_chunk(entry for _, entry in readable(batch))
+        rows = range(len(entries))
+
+    if isinstance(entries, ColumnStore):
+        store_chunks = _StoreChunks(entries)
+        for rows_chunk in _row_chunks(rows, chunk_rows):
+            yield store_chunks.chunk(rows_chunk)
+        return
+    for rows_chunk in _row_chunks(rows, chunk_rows):
+        yield _entry_chunk(entry for _, entry in readable(entries, rows_chunk))
+
+
+class _Encoder:
+    # turns column chunks into per-row text values; each distinct dictionary value or address is encoded once
+    # per export, and each distinct value of a plain column once per chunk
+    def __init__(self, encode):
+        self.encode = encode
+        self._coded = {}
+
+    def column(self, field, column):
+        if isinstance(column, _Coded):
+            encoded = self._coded.setdefault(field, [])
+            if len(encoded) < len(column.values):
+                encoded.extend(map(self.encode, column.values[len(encoded):]))
+            return map(encoded.__getitem__, column.codes)
+        if field in _NUMERIC_FIELDS:
+            return column
+        memo = {}
+        encoded = []
+        for value in column:
+            text = memo.get(value)
+            if text is None:
+                text = memo[value] = self.encode(value)
+            encoded.append(text)
+        return encoded
+
+
+def _csv_value(value):
+    return value if isinstance(value, str) or value is None else str(value)
+
+
+def _write_csv(chunks, f, fields, progress):
+    writer = csv.writer(f)
+    writer.writerow(fields)
+    encoder = _Encoder(_csv_value)
+    written = 0
+    for chunk in chunks:
+        writer.writerows(zip(*(encoder.column(field, chunk[field]) for field in fields)))
+        written += len(chunk['ts'])
+        if progress is not None:
+            progress(written)
+    return written
+
+
+def _json_value(value):
+    return 'null' if value is None else json.dumps(value if isinstance(value, (str, int, float)) else str(value))
+
+
+def _json_number(column):
+    if isinstance(column, list):
+        return ['null' if value is None else repr(value) for value in column]
+    return map(repr, column)
+
+
+def _write_jsonl(chunks, f, fields, progress):
+    # one %-template per row instead of a dict and json.dumps per row
+    template = '{' + ', '.join(f'{json.dumps(field)}: %s' for field in fields) + '}\n'
+    encoder = _Encoder(_json_value)
+    written = 0
+    for chunk in chunks:
+        columns = [_json_number(chunk[field]) if field in _NUMERIC_FIELDS else encoder.column(field, chunk[field])
+                   for field in fields]
+        f.write(''.join(map(template.__mod__, zip(*columns))))
+        written += len(chunk['ts'])
+        if progress is not None:
+            progress(written)
+    return written
+
+
+def _arrow_types():
+    return {
+        'ts': pyarrow.float64(),
+        'id_orig_p': pyarrow.uint16(),
+        'id_resp_p': pyarrow.uint16(),
+        'request_body_len': pyarrow.uint64(),
+        'response_body_len': pyarrow.uint64(),
+        'stat_code': pyarrow.uint16(),
+    }
+
+
+def _arrow_column(field, column, arrow_type, encoder):
+    if isinstance(column, (array.array, memoryview)):
+        # numeric columns go to Arrow as they are, without a Python object per row
+        return pyarrow.Array.from_buffers(arrow_type, len(column), [None, pyarrow.py_buffer(column)])
+    if field in _NUMERIC_FIELDS:
+        return pyarrow.array(column, arrow_type)
+    return pyarrow.array(list(encoder.column(field, column)), arrow_type)
+
+
+def _write_parquet(chunks, path, fields, progress, row_group_rows):
+    if pyarrow is None:
+        raise ImportError("exporting to Parquet needs the pyarrow package")
+
+    numeric_types = _arrow_types()
+    types = [numeric_types.get(field, pyarrow.string()) for field in fields]
+    schema = pyarrow.schema(list(zip(fields, types)))
+    # strings repeat heavily; Parquet dictionary-encodes them per row group
+    encoder = _Encoder(_csv_value)
+    written = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            arrays = [_arrow_column(field, chunk[field], arrow_type, encoder)
+                      for field, arrow_type in zip(fields, types)]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema), row_group_size=row_group_rows)
+            written += len(chunk['ts'])
+            if progress is not None:
+                progress(written)
+    return written
+
+
+FORMATS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+}
+
+
+def format_of(path):
+    # by extension; text formats may add .gz
+    root, ext = os.path.splitext(path)
+    if ext == '.gz':
+        ext = os.path.splitext(root)[1]
+    try:
+        return FORMATS[ext]
+    except KeyError:
+        raise ValueError(f"Cannot tell the export format of {path}; use .csv, .jsonl or .parquet") from None
+
+
+def export(source, path, format=None, fields=FIELDS, chunk_rows=CHUNK_ROWS, progress=None):
+    # Writes a Query, EntryView, HttpLog, LogDataset or any sequence of entries to CSV, JSONL or Parquet,
+    # chunk_rows rows at a time (one Parquet row group per chunk), and returns the number of rows written.
+    # progress, if given, is called with the running row count after every chunk. A row holds the values of
+    # to_dict() except ts, which is the raw epoch (seconds since 1970 as a float) rather than a datetime, so it
+    # reads back without a time zone guess.
+    format = format or format_of(path)
+    chunks = _chunks(source, chunk_rows)
+    if format == 'parquet':
+        return _write_parquet(chunks, path, fields, progress, chunk_rows)
+
+    writers = {'csv': _write_csv, 'jsonl': _write_jsonl}
+    if format not in writers:
+        raise ValueError(f"Unknown export format {format!r}")
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8', newline='') as f:
+        return writers[format](chunks, f, fields, progress)
+
+
+def _read_back(path, format):
+    if format == 'parquet':
+        return pyarrow.parquet.read_table(path).to_pylist()
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as f:
+        if format == 'jsonl':
+            return [json.loads(line) for line in f]
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        for field in _NUMERIC_FIELDS:
+            row[field] = float(row[field]) if field == 'ts' else int(row[field])
+    return rows
+
+
+def test_export_formats(path='http_first_100k.log', chunk_rows=10000):
+    # every format written from a column store, one mapped from a cache, a lazy log, a filtered query, a view and
+    # a plain iterator, and read back; Parquet only when pyarrow is installed
+    columnar = HttpLog(path, columnar=True)
+    lazy = HttpLog(path, lazy=True)
+    expected = [dict(entry.to_dict(), ts=entry.ts) for entry in columnar.entries]
+    query = columnar.query().status_class(4, 5)
+    filtered = [row for row in expected if row['stat_code'] // 100 in (4, 5)]
+    # an iterator is used up by one export, so each source is made anew
+    sources = [('store', lambda: columnar, expected), ('cached', lambda: cached, expected),
+               ('lazy', lambda: lazy, expected), ('query', lambda: query, filtered), ('view', query.view, filtered),
+               ('iterator', lambda: iter(lazy.entries), expected)]
+    names = ['http.csv', 'http.csv.gz', 'http.jsonl'] + (['http.parquet'] if pyarrow is not None else [])
+
+    with tempfile.TemporaryDirectory() as directory:
+        HttpLog(path, columnar=True, cache=True, cache_dir=directory)
+        cached = HttpLog(path, columnar=True, cache=True, cache_dir=directory)
+        assert not isinstance(cached.entries.ts, array.array)
+        for name in names:
+            out = os.path.join(directory, name)
+            for source_name, source, rows in sources:
+                assert export(source(), out, chunk_rows=chunk_rows) == len(rows), (name, source_name)
+                assert _read_back(out, format_of(out)) == rows, (name, source_name)
+            print(f"{name}: {len(expected)} rows")
+        # the mapped cache file is released before its directory is removed
+        del cached
@@ -0,0 +1,57 @@
+import ipaddress
+
+# Positions of the raw Zeek http.log columns used for cheap checks before a line is decoded
+ORIG_H_FIELD = 2
+METHOD_FIELD = 7
+URI_FIELD = 9
+STATUS_FIELD = 14
+
+
+class Where:
+    def __init__(self, addr=None, stat_code=None, extension=None, method=None, predicate=None):
+        self.addr = ipaddress.ip_address(addr) if addr is not None else None
+        self.stat_code = stat_code
+        self.extension = extension
+        self.method = method
+        self.predicate = predicate
+
+        self._addr_text = str(self.addr) if self.addr is not None else None
+        self._stat_text = str(stat_code) if stat_code is not None else None
+
+    def match_fields(self, fields):
+        # Zeek writes addresses and status codes in canonical form, so plain string comparison is enough
+        try:
+            if self._stat_text is not None and fields[STATUS_FIELD] != self._stat_text:
+                return False
+            if self.method is not None and fields[METHOD_FIELD] != self.method:
+                return False
+            if self.extension is not None and not fields[URI_FIELD].endswith(self.extension):
+                return False
+            if self._addr_text is not None and fields[ORIG_H_FIELD] != self._addr_text:
+                return False
+        except IndexError:
+            return False
+        return True
+
+    def match(self, entry):
+        if self.stat_code is not None and entry.stat_code != self.stat_code:
+            return False
+        if self.method is not None and entry.method != self.method:
+            return False
+        if self.extension is not None and not entry.uri.endswith(self.extension):
+            return False
+        if self.addr is not None and entry.id_orig_h != self.addr:
+            return False
+        return self.predicate is None or self.predicate(entry)
+
+    def match_decoded(self, entry):
+        # for entries whose raw fields already passed match_fields
+        return self.predicate is None or self.predicate(entry)
+
+
+def as_where(where):
+    if where is None or isinstance(where, Where):
+        return where
+    if callable(where):
+        return Where(predicate=where)
+    raise TypeError(f"where must be a Where or a callable, not {type(where).__name__}")
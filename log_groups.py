@@ -0,0 +1,133 @@
+import array
+from collections.abc import Mapping
+from itertools import accumulate
+
+from log_columns import DICTIONARY_COLUMNS, ColumnStore, IpColumn
+from log_views import EntryView, readable
+
+CONNECTION_FIELDS = ('id_orig_h', 'id_orig_p', 'id_resp_h', 'id_resp_p')
+
+
+def _field_key(fields):
+    if len(fields) == 1:
+        field = fields[0]
+        return lambda entry: getattr(entry, field)
+    return lambda entry: tuple(getattr(entry, field) for field in fields)
+
+
+def _store_ids(store, fields):
+    # group identity only needs the raw column integers; values are decoded once per group afterwards
+    columns = []
+    for field in fields:
+        if field in DICTIONARY_COLUMNS:
+            columns.append(store.get_array(field + '_codes'))
+            continue
+        column = getattr(store, field)
+        if isinstance(column, IpColumn):
+            columns.extend((column.hi, column.lo))
+        else:
+            columns.append(column)
+    return range(len(store)), columns[0] if len(columns) == 1 else zip(*columns)
+
+
+def _entry_ids(entries, fields):
+    rows = array.array('I')
+    raw = []
+    key = _field_key(fields)
+    for row, entry in readable(entries):
+        rows.append(row)
+        raw.append(key(entry))
+    return rows, raw
+
+
+class Grouping:
+    # CSR layout: rows are permuted so every group is contiguous, and group g is order[offsets[g]:offsets[g + 1]].
+    # Beyond one dict entry per group this costs two uint32 per row; groups keep the order they first appear in,
+    # and rows keep log order within a group.
+    def __init__(self, entries, *fields):
+        self.entries = entries
+        self.fields = fields
+        if isinstance(entries, ColumnStore):
+            rows, raw = _store_ids(entries, fields)
+        else:
+            rows, raw = _entry_ids(entries, fields)
+
+        group_ids = {}
+        first_rows = array.array('I')
+        ids = array.array('I')
+        for row, value in zip(rows, raw):
+            group = group_ids.get(value)
+            if group is None:
+                group = group_ids[value] = len(first_rows)
+                first_rows.append(row)
+            ids.append(group)
+
+        counts = array.array('I', bytes(4 * len(first_rows)))
+        for group in ids:
+            counts[group] += 1
+        self.offsets = array.array('I', accumulate(counts, initial=0))
+        positions = self.offsets[:-1]
+        self.order = array.array('I', bytes(4 * len(ids)))
+        for row, group in zip(rows, ids):
+            self.order[positions[group]] = row
+            positions[group] += 1
+
+        key = _field_key(fields)
+        self._groups = {key(entries[row]): group for group, row in enumerate(first_rows)}
+        self._order = memoryview(self.order)
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __contains__(self, key):
+        return key in self._groups
+
+    def keys(self):
+        return self._groups.keys()
+
+    def rows(self, key):
+        # a slice of a memoryview shares the permutation, so no row numbers are copied
+        group = self._groups.get(key)
+        if group is None:
+            return self._order[:0]
+        return self._order[self.offsets[group]:self.offsets[group + 1]]
+
+    def size(self, key):
+        group = self._groups.get(key)
+        return 0 if group is None else self.offsets[group + 1] - self.offsets[group]
+
+    def view(self, key):
+        return EntryView(self.entries, self.rows(key))
+
+    def items(self):
+        for key in self._groups:
+            yield key, self.view(key)
+
+    def dicts(self, to_dict=None):
+        return GroupedDicts(self, to_dict)
+
+
+class GroupedDicts(Mapping):
+    # what log_to_dict used to build: group key -> list of per-entry dicts, made only for the group asked for
+    def __init__(self, grouping, to_dict=None):
+        self.grouping = grouping
+        self.to_dict = to_dict or (lambda entry: entry.to_dict())
+
+    def __getitem__(self, key):
+        if key not in self.grouping:
+            raise KeyError(key)
+        return [self.to_dict(entry) for entry in self.grouping.view(key)]
+
+    def __iter__(self):
+        return iter(self.grouping.keys())
+
+    def __len__(self):
+        return len(self.grouping)
+
+
+def grouping(log, *fields):
+    # an HttpLog keeps its groupings; anything else is grouped on the spot
+    grouped = getattr(log, 'grouping', None)
+    if grouped is not None:
+        return grouped(*fields)
+    return Grouping(log, *fields)
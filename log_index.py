@@ -0,0 +1,121 @@
+import array
+import bisect
+import heapq
+
+from log_columns import ColumnStore
+from log_views import EntryView, readable
+
+INDEXED_FIELDS = ('id_orig_h', 'id_resp_h', 'stat_code', 'method')
+# derived partition keys: the field they read and how a value maps to its bucket
+PARTITION_KEYS = {
+    'status_class': ('stat_code', lambda code: code // 100),
+}
+
+
+def row_values(entries, field, start=0):
+    if isinstance(entries, ColumnStore):
+        yield from enumerate(entries.column_values(field, start), start)
+        return
+
+    for row, entry in readable(entries, range(start, len(entries))):
+        yield row, getattr(entry, field)
+
+
+class HashIndex:
+    def __init__(self, field):
+        self.field = field
+        self.rows = {}
+        self.size = 0
+
+    def update(self, entries):
+        rows = self.rows
+        for row, value in row_values(entries, self.field, self.size):
+            bucket = rows.get(value)
+            if bucket is None:
+                bucket = rows[value] = array.array('I')
+            bucket.append(row)
+        self.size = len(entries)
+
+    def lookup(self, value):
+        return self.rows.get(value, array.array('I'))
+
+    def keys(self):
+        return self.rows.keys()
+
+
+class SuffixIndex:
+    # URIs are stored reversed and sorted, so every URI ending with a suffix forms one bisect range
+    def __init__(self, field='uri'):
+        self.values = HashIndex(field)
+        self.reversed_keys = []
+
+    def update(self, entries):
+        known = len(self.values.rows)
+        self.values.update(entries)
+        if len(self.values.rows) == known:
+            return
+
+        new_keys = [value[::-1] for value in list(self.values.rows)[known:]]
+        if len(new_keys) > len(self.reversed_keys):
+            self.reversed_keys = sorted(self.reversed_keys + new_keys)
+        else:
+            for key in new_keys:
+                bisect.insort(self.reversed_keys, key)
+
+    def lookup(self, suffix):
+        prefix = suffix[::-1]
+        keys = self.reversed_keys
+        buckets = []
+
+        pos = bisect.bisect_left(keys, prefix)
+        while pos < len(keys) and keys[pos].startswith(prefix):
+            buckets.append(self.values.rows[keys[pos][::-1]])
+            pos += 1
+
+        if len(buckets) == 1:
+            return buckets[0]
+        return array.array('I', heapq.merge(*buckets))
+
+
+class Partition:
+    # Rows bucketed by a small-cardinality key (a field, or a derived key such as 'status_class') in one pass.
+    # Each distinct value is classified once; buckets are row arrays, so views over them never copy entries.
+    def __init__(self, key):
+        self.key = key
+        self.field, self.classify = PARTITION_KEYS.get(key, (key, None))
+        self.rows = {}
+        self.size = 0
+        self._value_buckets = {}
+
+    def update(self, entries):
+        rows, value_buckets, classify = self.rows, self._value_buckets, self.classify
+        for row, value in row_values(entries, self.field, self.size):
+            bucket = value_buckets.get(value)
+            if bucket is None:
+                key = value if classify is None else classify(value)
+                bucket = rows.get(key)
+                if bucket is None:
+                    bucket = rows[key] = array.array('I')
+                value_buckets[value] = bucket
+            bucket.append(row)
+        self.size = len(entries)
+
+    def lookup(self, key):
+        return self.rows.get(key, array.array('I'))
+
+    def keys(self):
+        return self.rows.keys()
+
+    def counts(self):
+        return {key: len(rows) for key, rows in self.rows.items()}
+
+
+def partition_views(log, key, *values):
+    # one view per requested bucket; an HttpLog keeps its partitions, anything else is partitioned on the spot
+    partition = getattr(log, 'partition', None)
+    if partition is not None:
+        entries, partition = log.entries, partition(key)
+    else:
+        entries, partition = log, Partition(key)
+        partition.update(entries)
+    return [EntryView(entries, partition.lookup(value)) for value in values]
@@ -0,0 +1,27 @@
+import ipaddress
+import sys
+
+# A busy log sees far fewer distinct addresses than lines. Parsing each distinct text once and handing every
+# line the same object saves both the pure-Python parse and the per-entry copies.
+MAX_ADDRESSES = 1 << 20
+
+_addresses = {}
+
+
+def address(text):
+    addr = _addresses.get(text)
+    if addr is None:
+        addr = ipaddress.ip_address(text)
+        if len(_addresses) >= MAX_ADDRESSES:
+            # a crude bound, but cheaper than LRU bookkeeping on every hit
+            _addresses.clear()
+        _addresses[text] = addr
+    return addr
+
+
+# uids, methods and URIs repeat across lines; interned, equal strings are one shared object
+string = sys.intern
+
+
+def clear():
+    _addresses.clear()
@@ -0,0 +1,95 @@
+import time
+from collections import Counter, deque, namedtuple
+
+BadLine = namedtuple('BadLine', ['reason', 'column', 'message', 'line'])
+
+PHASES = ('io', 'split', 'convert', 'construct')
+
+
+class LoadMetrics:
+    # Counters for one HttpLog load. Phase times are [wall, cpu] seconds; without profiling only the whole
+    # 'parse' loop (which includes reading) is timed, with profiling it is split into PHASES per line.
+    def __init__(self, sample_size=100, hooks=()):
+        self.lines_read = 0
+        self.bytes_read = 0
+        self.rows_accepted = 0
+        self.rows_rejected = 0
+        self.rejects_by_reason = Counter()
+        self.rejects_by_column = Counter()
+        self.samples = deque(maxlen=sample_size)
+        self.phases = {}
+        self.hooks = list(hooks)
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def reject(self, error, line):
+        reason = getattr(error, 'reason', None) or 'invalid value'
+        column = getattr(error, 'column', None)
+        self.rows_rejected += 1
+        self.rejects_by_reason[reason] += 1
+        if column is not None:
+            self.rejects_by_column[column] += 1
+        if self.samples.maxlen != 0:
+            self.samples.append(BadLine(reason, column, str(error), line.rstrip('\r\n')))
+
+    def add_time(self, phase, wall, cpu):
+        times = self.phases.get(phase)
+        if times is None:
+            times = self.phases[phase] = [0.0, 0.0]
+        times[0] += wall
+        times[1] += cpu
+
+    def timed(self, phase):
+        return _PhaseTimer(self, phase)
+
+    def merge(self, other):
+        # phase times of merged metrics add up, so for parallel loads they are summed over the workers
+        self.lines_read += other.lines_read
+        self.bytes_read += other.bytes_read
+        self.rows_accepted += other.rows_accepted
+        self.rows_rejected += other.rows_rejected
+        self.rejects_by_reason.update(other.rejects_by_reason)
+        self.rejects_by_column.update(other.rejects_by_column)
+        self.samples.extend(other.samples)
+        for phase, (wall, cpu) in other.phases.items():
+            self.add_time(phase, wall, cpu)
+
+    def publish(self):
+        for hook in list(self.hooks):
+            hook(self)
+
+    def __getstate__(self):
+        # hooks usually close over the caller's objects, so they stay behind when metrics cross processes
+        state = self.__dict__.copy()
+        state['hooks'] = []
+        return state
+
+    def to_dict(self):
+        return {
+            'lines_read': self.lines_read,
+            'bytes_read': self.bytes_read,
+            'rows_accepted': self.rows_accepted,
+            'rows_rejected': self.rows_rejected,
+            'rejects_by_reason': dict(self.rejects_by_reason),
+            'rejects_by_column': dict(self.rejects_by_column),
+            'phases': {phase: {'wall': wall, 'cpu': cpu} for phase, (wall, cpu) in self.phases.items()},
+            'samples': [sample._asdict() for sample in self.samples]
+        }
+
+
+class _PhaseTimer:
+    def __init__(self, metrics, phase):
+        self.metrics = metrics
+        self.phase = phase
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.phase, time.perf_counter() - self.wall, time.thread_time() - self.cpu)
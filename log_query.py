@@ -0,0 +1,383 @@
+import array
+import copy
+import heapq
+import ipaddress
+import math
+import re
+from itertools import compress, islice
+
+from log_columns import DICTIONARY_COLUMNS, ColumnStore, IpColumn, decode_ip, encode_ip
+from log_entry import HttpLogEntry
+from log_index import HashIndex, SuffixIndex
+from log_views import EntryView, readable
+from time_index import TimeIndex, to_epoch
+
+_V4_MAPPED_NETWORK = ipaddress.ip_network('::ffff:0:0/96')
+
+
+def _rows_mask(rows, count):
+    mask = bytearray(count)
+    if isinstance(rows, range) and rows.step == 1:
+        mask[rows.start:rows.stop] = b'\1' * len(rows)
+    else:
+        for row in rows:
+            mask[row] = 1
+    return mask
+
+
+def _and(a, b):
+    # masks hold only 0 and 1 bytes, so one big-integer AND combines them a machine word at a time
+    count = len(a)
+    return (int.from_bytes(a, 'little') & int.from_bytes(b, 'little')).to_bytes(count, 'little')
+
+
+def _merge_rows(buckets):
+    if len(buckets) == 1:
+        return buckets[0]
+    return array.array('I', heapq.merge(*buckets))
+
+
+class _TimeRange:
+    def __init__(self, start, end):
+        self.start = None if start is None else to_epoch(start)
+        self.end = None if end is None else to_epoch(end)
+
+    def narrow(self, start, end):
+        start = None if start is None else to_epoch(start)
+        end = None if end is None else to_epoch(end)
+        if start is not None and (self.start is None or start > self.start):
+            self.start = start
+        if end is not None and (self.end is None or end < self.end):
+            self.end = end
+
+    def rows(self, query):
+        time_index = query.time_index()
+        if time_index is None:
+            return None
+        rows = time_index.rows(self.start, self.end)
+        # a permutation slice is in time order; results are always returned in row order
+        return rows if isinstance(rows, range) else array.array(rows.typecode, sorted(rows))
+
+    def mask(self, query, store):
+        return _rows_mask(self.rows(query), len(store))
+
+    def test(self):
+        # bounds were converted to epochs once, so rows compare plain floats
+        start = -math.inf if self.start is None else self.start
+        end = math.inf if self.end is None else self.end
+        return lambda entry: start <= entry.ts <= end
+
+
+class _FieldMatch:
+    def __init__(self, field, match, values=None, suffix=None):
+        self.field = field
+        self.match = match
+        # exact values and URI suffixes can also be answered by one of the log's indexes
+        self.values = values
+        self.suffix = suffix
+
+    def rows(self, query, build=True):
+        if self.values is None and self.suffix is None:
+            return None
+        index = query.index(self.field, build)
+        if index is None:
+            return None
+        if self.values is not None and isinstance(index, HashIndex):
+            return _merge_rows([index.lookup(value) for value in self.values])
+        if self.suffix is not None and isinstance(index, SuffixIndex):
+            return index.lookup(self.suffix)
+        return None
+
+    def mask(self, query, store):
+        # a column scan is cheap, so a mask only uses an index the log has already built
+        rows = self.rows(query, build=False)
+        if rows is not None:
+            return _rows_mask(rows, len(store))
+
+        match = self.match
+        if self.field in DICTIONARY_COLUMNS:
+            # each distinct value is matched once; rows then only look up their code
+            flags = bytes(bool(match(value)) for value in getattr(store, self.field).values)
+            return bytes(map(flags.__getitem__, store.get_array(self.field + '_codes')))
+
+        column = getattr(store, self.field)
+        if isinstance(column, IpColumn):
+            decoded = {}
+            mask = bytearray()
+            for key in zip(column.hi, column.lo):
+                flag = decoded.get(key)
+                if flag is None:
+                    flag = decoded[key] = bool(match(decode_ip(*key)))
+                mask.append(flag)
+            return mask
+        if getattr(column, 'typecode', None) == 'H' or getattr(column, 'format', None) == 'H':
+            # only the distinct codes present are matched, then every row is a table lookup
+            flags = bytearray(1 << 16)
+            for value in set(column):
+                flags[value] = bool(match(value))
+            return bytes(map(flags.__getitem__, column))
+        return bytes(bool(match(value)) for value in column)
+
+    def test(self):
+        field, match = self.field, self.match
+        return lambda entry: match(getattr(entry, field))
+
+
+class _Network:
+    def __init__(self, field, network):
+        self.field = field
+        self.network = network
+
+    def rows(self, query, build=True):
+        if self.network.num_addresses != 1:
+            return None
+        index = query.index(self.field, build)
+        if index is None:
+            return None
+        return index.lookup(self.network.network_address)
+
+    def mask(self, query, store):
+        rows = self.rows(query, build=False)
+        if rows is not None:
+            return _rows_mask(rows, len(store))
+
+        column = getattr(store, self.field)
+        first_hi, first_lo = encode_ip(self.network.network_address)
+        last_hi, last_lo = encode_ip(self.network.broadcast_address)
+        if first_hi == last_hi:
+            # every IPv4 network and every IPv6 prefix of /64 or longer lies within one hi word
+            mask = bytes(hi == first_hi and first_lo <= lo <= last_lo for hi, lo in zip(column.hi, column.lo))
+        else:
+            first = first_hi << 64 | first_lo
+            last = last_hi << 64 | last_lo
+            mask = bytes(first <= (hi << 64 | lo) <= last for hi, lo in zip(column.hi, column.lo))
+
+        if self.network.version == 6 and self.network.overlaps(_V4_MAPPED_NETWORK):
+            # IPv4 rows are stored IPv4-mapped, but an IPv6 network never contains an IPv4 address
+            mask = _and(mask, bytes(hi != 0 or lo >> 32 != 0xffff for hi, lo in zip(column.hi, column.lo)))
+        return mask
+
+    def test(self):
+        field, network = self.field, self.network
+        return lambda entry: getattr(entry, field) in network
+
+
+class _Predicate:
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def rows(self, query):
+        return None
+
+    mask = None
+
+    def test(self):
+        return self.predicate
+
+
+def _network(value):
+    if isinstance(value, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+        return ipaddress.ip_network(value)
+    return ipaddress.ip_network(value, strict=False)
+
+
+class Query:
+    # Conditions are ANDed. On a ColumnStore each one becomes a byte mask over all rows; otherwise the
+    # smallest candidate row set (time range or a built index) is scanned once, testing the rest per entry.
+    # Every builder method returns a new Query, so a partial query can be reused.
+    def __init__(self, entries, log=None):
+        if not hasattr(entries, '__getitem__'):
+            entries = list(entries)
+        self.entries = entries
+        self.log = log
+        self._time = None
+        self._conditions = ()
+        self._offset = 0
+        self._limit = None
+
+    def _with(self, condition):
+        query = copy.copy(self)
+        query._conditions = self._conditions + (condition,)
+        return query
+
+    def time(self, start=None, end=None):
+        query = copy.copy(self)
+        if self._time is None:
+            query._time = _TimeRange(start, end)
+        else:
+            query._time = copy.copy(self._time)
+            query._time.narrow(start, end)
+        return query
+
+    def src_in(self, *networks):
+        return self._networks('id_orig_h', networks)
+
+    def dst_in(self, *networks):
+        return self._networks('id_resp_h', networks)
+
+    def _networks(self, field, networks):
+        networks = [_network(value) for value in networks]
+        if len(networks) == 1:
+            return self._with(_Network(field, networks[0]))
+        return self._with(_FieldMatch(field, lambda addr: any(addr in network for network in networks)))
+
+    def status(self, *codes):
+        codes = frozenset(codes)
+        return self._with(_FieldMatch('stat_code', codes.__contains__, codes))
+
+    def status_class(self, *classes):
+        classes = frozenset(classes)
+        return self._with(_FieldMatch('stat_code', lambda code: code // 100 in classes))
+
+    def method(self, *methods):
+        methods = frozenset(methods)
+        return self._with(_FieldMatch('method', methods.__contains__, methods))
+
+    def uri_regex(self, pattern, flags=0):
+        search = re.compile(pattern, flags).search
+        return self._with(_FieldMatch('uri', lambda uri: search(uri) is not None))
+
+    def extension(self, extension):
+        return self._with(_FieldMatch('uri', lambda uri: uri.endswith(extension), suffix=extension))
+
+    def where(self, predicate):
+        return self._with(_Predicate(predicate))
+
+    def offset(self, offset):
+        query = copy.copy(self)
+        query._offset = offset
+        return query
+
+    def limit(self, limit):
+        query = copy.copy(self)
+        query._limit = limit
+        return query
+
+    def time_index(self):
+        if self.log is not None:
+            return self.log.time_index()
+        if isinstance(self.entries, ColumnStore):
+            return TimeIndex(self.entries.ts)
+        return None
+
+    def index(self, field, build=True):
+        # an HttpLog builds an index on first use and keeps it up to date, so repeated lookups skip the scan
+        if self.log is None:
+            return None
+        return self.log.index(field) if build else self.log.built_index(field)
+
+    def _conditions_all(self):
+        return self._conditions if self._time is None else (self._time,) + self._conditions
+
+    def _vectorized(self):
+        return isinstance(self.entries, ColumnStore) and all(condition.mask is not None
+                                                             for condition in self._conditions_all())
+
+    def _combined_mask(self, conditions):
+        # None when there is nothing to mask, i.e. every row matches
+        mask = None
+        for condition in conditions:
+            part = condition.mask(self, self.entries)
+            mask = part if mask is None else _and(mask, part)
+            if 1 not in mask:
+                break
+        return mask
+
+    def _matching(self):
+        # yields (row, entry) pairs; entry is None where no test needed the row decoded
+        entries = self.entries
+        conditions = self._conditions_all()
+
+        if isinstance(entries, ColumnStore):
+            mask = self._combined_mask([condition for condition in conditions if condition.mask is not None])
+            tests = [condition.test() for condition in conditions if condition.mask is None]
+            rows = range(len(entries)) if mask is None else compress(range(len(entries)), mask)
+            if not tests:
+                return ((row, None) for row in rows)
+        else:
+            candidates = [(condition, condition.rows(self)) for condition in conditions]
+            candidates = [(len(rows), position, condition, rows)
+                          for position, (condition, rows) in enumerate(candidates) if rows is not None]
+            if candidates:
+                _, _, chosen, rows = min(candidates)
+            else:
+                chosen, rows = None, range(len(entries))
+            tests = [condition.test() for condition in conditions if condition is not chosen]
+
+        return self._tested(rows, tests)
+
+    def _tested(self, rows, tests):
+        for row, entry in readable(self.entries, rows):
+            if all(test(entry) for test in tests):
+                yield row, entry
+
+    def _page(self):
+        stop = None if self._limit is None else self._offset + self._limit
+        return islice(self._matching(), self._offset, stop)
+
+    def rows(self):
+        return (row for row, _ in self._page())
+
+    def view(self):
+        return EntryView(self.entries, array.array('Q', self.rows()))
+
+    def __iter__(self):
+        entries = self.entries
+        for row, entry in self._page():
+            yield entries[row] if entry is None else entry
+
+    def all(self):
+        return list(self)
+
+    def first(self):
+        return next(iter(self.limit(1)), None)
+
+    def count(self):
+        if not self._vectorized():
+            return sum(1 for _ in self._page())
+
+        mask = self._combined_mask(self._conditions_all())
+        total = len(self.entries) if mask is None else mask.count(1)
+        total = max(total - self._offset, 0)
+        return total if self._limit is None else min(total, self._limit)
+
+
+def as_query(log):
+    if isinstance(log, Query):
+        return log
+    query = getattr(log, 'query', None)
+    if query is not None:
+        return query()
+    return Query(log)
+
+
+def test_query_vs_linear(path='http_first_100k.log'):
+    # every condition through column masks, through entry tests and as a plain filter over the same rows
+    with open(path) as f:
+        store = ColumnStore.from_lines(f)
+    entries = list(map(HttpLogEntry.from_values, store.values()))
+    first = entries[0]
+    middle = entries[len(entries) // 2].ts
+    network = ipaddress.ip_network(f'{first.id_orig_h}/{16 if first.id_orig_h.version == 4 else 64}', strict=False)
+    pattern = re.compile(r'\.php$|admin')
+    cases = [
+        ('status', lambda query: query.status(404), lambda entry: entry.stat_code == 404),
+        ('status_class', lambda query: query.status_class(4, 5), lambda entry: entry.stat_code // 100 in (4, 5)),
+        ('method', lambda query: query.method('GET', 'POST'), lambda entry: entry.method in ('GET', 'POST')),
+        ('src_in network', lambda query: query.src_in(network), lambda entry: entry.id_orig_h in network),
+        ('src_in address', lambda query: query.src_in(first.id_orig_h),
+         lambda entry: entry.id_orig_h == first.id_orig_h),
+        ('extension', lambda query: query.extension('.jpg'), lambda entry: entry.uri.endswith('.jpg')),
+        ('uri_regex', lambda query: query.uri_regex(pattern.pattern),
+         lambda entry: pattern.search(entry.uri) is not None),
+        ('time', lambda query: query.time(None, middle), lambda entry: entry.ts <= middle),
+        ('combined', lambda query: query.time(middle).status_class(2).method('GET'),
+         lambda entry: entry.ts >= middle and entry.stat_code // 100 == 2 and entry.method == 'GET'),
+    ]
+    for name, build, test in cases:
+        expected = [row for row, entry in enumerate(entries) if test(entry)]
+        assert expected, name
+        assert list(build(Query(store)).rows()) == expected, name
+        assert list(build(Query(entries)).rows()) == expected, name
+        assert build(Query(store)).count() == len(expected), name
+        print(f"{name}: {len(expected)} rows")
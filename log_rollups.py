@@ -0,0 +1,228 @@
+import bisect
+import math
+
+from log_columns import ColumnStore
+from log_views import readable
+from time_index import TimeIndex, to_epoch
+
+RESOLUTIONS = {'second': 1, 'minute': 60, 'hour': 3600}
+COLUMNS = ('requests', '1xx', '2xx', '3xx', '4xx', '5xx', 'other', 'request_bytes', 'response_bytes')
+_CLASS_COLUMNS = {status_class: position for position, status_class in enumerate(range(1, 6), 1)}
+_OTHER = COLUMNS.index('other')
+_REQUEST_BYTES = COLUMNS.index('request_bytes')
+_RESPONSE_BYTES = COLUMNS.index('response_bytes')
+_WIDTHS = sorted(RESOLUTIONS.values(), reverse=True)
+
+
+class _Bucket:
+    __slots__ = ('counts', 'methods')
+
+    def __init__(self):
+        self.counts = [0] * len(COLUMNS)
+        self.methods = {}
+
+    def add(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        methods = self.methods
+        for method, count in other.methods.items():
+            methods[method] = methods.get(method, 0) + count
+
+    def to_dict(self):
+        totals = dict(zip(COLUMNS, self.counts))
+        totals['methods'] = dict(self.methods)
+        return totals
+
+
+def _records(entries, rows):
+    # (ts, stat_code, method, request_body_len, response_body_len) for each readable row
+    if isinstance(entries, ColumnStore):
+        methods = entries.method.values
+        columns = (entries.ts, entries.stat_code, entries.get_array('method_codes'), entries.request_body_len,
+                   entries.response_body_len)
+        if isinstance(rows, range) and rows.step == 1:
+            columns = [column[rows.start:rows.stop] for column in columns]
+            for ts, stat_code, method, request_len, response_len in zip(*columns):
+                yield ts, stat_code, methods[method], request_len, response_len
+            return
+        ts, stat_code, method, request_len, response_len = columns
+        for row in rows:
+            yield ts[row], stat_code[row], methods[method[row]], request_len[row], response_len[row]
+        return
+
+    for _, entry in readable(entries, rows):
+        yield entry.ts, entry.stat_code, entry.method, entry.request_body_len, entry.response_body_len
+
+
+def _tally(records, width=None):
+    # buckets keyed by second (or all in one bucket when width is None)
+    buckets = {}
+    for ts, stat_code, method, request_len, response_len in records:
+        key = None if width is None else math.floor(ts / width)
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _Bucket()
+        counts = bucket.counts
+        counts[0] += 1
+        counts[_CLASS_COLUMNS.get(stat_code // 100, _OTHER)] += 1
+        counts[_REQUEST_BYTES] += request_len
+        counts[_RESPONSE_BYTES] += response_len
+        bucket.methods[method] = bucket.methods.get(method, 0) + 1
+    return buckets
+
+
+class Rollups:
+    # Per second, minute and hour: request counts by status class and method, and body bytes. Rows are folded
+    # into seconds once, then each touched second into its minute and hour, so update() only reads new rows.
+    # Range totals use the coarsest buckets that fit inside the range; only rows in the partial seconds at
+    # either end are read, through the time index, so totals are exact.
+    def __init__(self, entries, time_index):
+        self.entries = entries
+        self.time_index = time_index
+        self.size = 0
+        self.levels = {width: {} for width in _WIDTHS}
+        self._keys = {width: [] for width in _WIDTHS}
+
+    def update(self):
+        entries = self.entries
+        if len(entries) == self.size:
+            return
+        seconds = _tally(_records(entries, range(self.size, len(entries))), 1)
+        self.size = len(entries)
+
+        for width in _WIDTHS:
+            level, keys = self.levels[width], self._keys[width]
+            new_keys = []
+            for second, delta in seconds.items():
+                key = second // width
+                bucket = level.get(key)
+                if bucket is None:
+                    bucket = level[key] = _Bucket()
+                    new_keys.append(key)
+                bucket.add(delta)
+            if new_keys:
+                new_keys.sort()
+                in_order = not keys or keys[-1] < new_keys[0]
+                keys.extend(new_keys)
+                if not in_order:
+                    keys.sort()
+
+    def _bucket_range(self, width, start, end):
+        # buckets of one level whose span lies in [start, end); None is unbounded
+        keys = self._keys[width]
+        lo = 0 if start is None else bisect.bisect_left(keys, start // width)
+        hi = len(keys) if end is None else bisect.bisect_left(keys, end // width)
+        level = self.levels[width]
+        return (level[key] for key in keys[lo:hi])
+
+    def _cover(self, total, start, end, widths):
+        # start and end are whole seconds (or None); coarse buckets first, finer ones for what is left over
+        if (start is not None and end is not None and start >= end) or not widths:
+            return
+        width = widths[0]
+        first = None if start is None else -(-start // width) * width
+        last = None if end is None else end // width * width
+        if first is not None and last is not None and first >= last:
+            self._cover(total, start, end, widths[1:])
+            return
+        for bucket in self._bucket_range(width, first, last):
+            total.add(bucket)
+        if first is not None:
+            self._cover(total, start, first, widths[1:])
+        if last is not None:
+            self._cover(total, last, end, widths[1:])
+
+    def totals(self, start=None, end=None):
+        # like HttpLog.between, start <= ts <= end; datetimes, dates or epochs
+        self.update()
+        start = None if start is None else to_epoch(start)
+        end = None if end is None else to_epoch(end)
+        total = _Bucket()
+        first = None if start is None else math.ceil(start)
+        last = None if end is None else math.floor(end)
+
+        edges = []
+        if first is not None and last is not None and first >= last:
+            edges.append((start, end))
+        else:
+            self._cover(total, first, last, _WIDTHS)
+            if start is not None:
+                edges.append((start, math.nextafter(first, -math.inf)))
+            if end is not None:
+                edges.append((last, end))
+
+        for edge_start, edge_end in edges:
+            rows = self.time_index().rows(edge_start, edge_end)
+            for bucket in _tally(_records(self.entries, rows)).values():
+                total.add(bucket)
+        return total.to_dict()
+
+    def rate(self, column='requests', start=None, end=None):
+        # per second over [start, end]; open ends are the first and last timestamps
+        time_index = self.time_index()
+        start = time_index.min() if start is None else to_epoch(start)
+        end = time_index.max() if end is None else to_epoch(end)
+        if start is None or end is None or end <= start:
+            return 0.0
+        return self.totals(start, end)[column] / (end - start)
+
+    def buckets(self, resolution='minute', start=None, end=None):
+        # (bucket start epoch, totals) for every non-empty bucket overlapping [start, end]
+        self.update()
+        width = RESOLUTIONS[resolution]
+        level, keys = self.levels[width], self._keys[width]
+        lo = 0 if start is None else bisect.bisect_left(keys, math.floor(to_epoch(start) / width))
+        hi = len(keys) if end is None else bisect.bisect_right(keys, math.floor(to_epoch(end) / width))
+        for key in keys[lo:hi]:
+            yield key * width, level[key].to_dict()
+
+    def histogram(self, start=None, end=None, bins=100, columns=('requests',)):
+        # Counts for at most about `bins` equal bins over [start, end], summed from the rollup buckets.
+        # Returns (first bin epoch, bin seconds, {column: counts}).
+        self.update()
+        time_index = self.time_index()
+        start = time_index.min() if start is None else to_epoch(start)
+        end = time_index.max() if end is None else to_epoch(end)
+        if start is None or end is None:
+            return 0.0, 1, {column: [] for column in columns}
+
+        # a bin is a whole number of buckets of the coarsest resolution that still fits inside one bin
+        bin_seconds = max(end - start, 1) / bins
+        width = next((width for width in _WIDTHS if width <= bin_seconds), 1)
+        step = width * math.ceil(bin_seconds / width)
+        first = math.floor(start / step) * step
+        count = math.floor((end - first) / step) + 1
+        positions = [COLUMNS.index(column) for column in columns]
+        counts = {column: [0] * count for column in columns}
+        level, keys = self.levels[width], self._keys[width]
+        lo = bisect.bisect_left(keys, first // width)
+        hi = bisect.bisect_left(keys, (first + count * step) // width)
+        for key in keys[lo:hi]:
+            position = (key * width - first) // step
+            bucket_counts = level[key].counts
+            for column, column_position in zip(columns, positions):
+                counts[column][position] += bucket_counts[column_position]
+        return first, step, counts
+
+
+def test_totals_vs_rows(path='http_first_100k.log'):
+    # rollup totals against a plain count over the rows, for the whole log and for ranges with partial seconds
+    with open(path) as f:
+        store = ColumnStore.from_lines(f)
+    rollups = Rollups(store, lambda: TimeIndex(store.ts))
+    records = list(_records(store, range(len(store))))
+
+    epochs = sorted(store.ts)
+    ranges = [(None, None), (epochs[len(epochs) // 3] + 0.25, epochs[2 * len(epochs) // 3] - 0.25),
+              (epochs[0] + 59.5, None), (epochs[0] - 3600.5, epochs[-1] - 30.5), (epochs[10], epochs[10] + 0.5)]
+    for start, end in ranges:
+        low = -math.inf if start is None else start
+        high = math.inf if end is None else end
+        expected = _tally(record for record in records if low <= record[0] <= high).get(None, _Bucket()).to_dict()
+        assert rollups.totals(start, end) == expected, (start, end)
+
+    assert rollups.totals()['requests'] == len(store)
+    for resolution in RESOLUTIONS:
+        assert sum(totals['requests'] for _, totals in rollups.buckets(resolution)) == len(store), resolution
+    _, _, counts = rollups.histogram(bins=50)
+    assert sum(counts['requests']) == len(store)
+    print(f"rows: {len(store)}")
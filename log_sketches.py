@@ -0,0 +1,251 @@
+import array
+import hashlib
+import heapq
+import itertools
+import math
+from collections import Counter
+
+import log_sources
+import parallel_reader
+from log_entry import decode_fields
+
+_HASH_BITS = 64
+
+
+def stable_hash(value):
+    # Python's hash() of a str changes between processes, and sketches from different workers must agree
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'little')
+
+
+class CountMinSketch:
+    def __init__(self, width=2719, depth=5):
+        self.width = width
+        self.depth = depth
+        self.counters = array.array('Q', bytes(8 * width * depth))
+
+    @classmethod
+    def from_error(cls, epsilon=0.001, delta=0.01):
+        # estimates exceed the true count by at most epsilon * total with probability 1 - delta
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+    def _cells(self, hashed):
+        # double hashing: depth indexes from one 64-bit hash
+        first, step = hashed & 0xffffffff, hashed >> 32 | 1
+        width = self.width
+        return [row * width + (first + row * step) % width for row in range(self.depth)]
+
+    def add(self, key, count=1, hashed=None):
+        counters = self.counters
+        cells = self._cells(stable_hash(key) if hashed is None else hashed)
+        for cell in cells:
+            counters[cell] += count
+        return min(map(counters.__getitem__, cells))
+
+    def estimate(self, key, hashed=None):
+        counters = self.counters
+        return min(counters[cell] for cell in self._cells(stable_hash(key) if hashed is None else hashed))
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("only sketches of the same width and depth can be merged")
+        self.counters = array.array('Q', map(sum, zip(self.counters, other.counters)))
+
+
+class TopK:
+    # Count-Min estimates plus a min-heap over the heaviest keys seen; heap entries go stale when a tracked
+    # key's count grows and are refreshed only when the floor of the heap is needed. More than k candidates
+    # are tracked, so a key that is heavy overall but in no single partial's top k survives a merge.
+    def __init__(self, k=10, epsilon=0.001, delta=0.01, capacity=None):
+        self.k = k
+        self.capacity = capacity or 4 * k
+        self.sketch = CountMinSketch.from_error(epsilon, delta)
+        self.top = {}
+        self._heap = []
+        self._order = itertools.count()
+
+    def add(self, key, count=1, hashed=None):
+        estimate = self.sketch.add(key, count, hashed)
+        top = self.top
+        if key in top:
+            top[key] = estimate
+        elif len(top) < self.capacity:
+            self._track(key, estimate)
+        elif estimate > self._floor()[0]:
+            del top[heapq.heappop(self._heap)[2]]
+            self._track(key, estimate)
+
+    def _track(self, key, estimate):
+        self.top[key] = estimate
+        heapq.heappush(self._heap, (estimate, next(self._order), key))
+
+    def _floor(self):
+        heap, top = self._heap, self.top
+        while True:
+            count, _, key = heap[0]
+            current = top.get(key)
+            if current == count:
+                return heap[0]
+            heapq.heappop(heap)
+            if current is not None:
+                heapq.heappush(heap, (current, next(self._order), key))
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        candidates = set(self.top) | set(other.top)
+        ranked = heapq.nlargest(self.capacity, ((self.sketch.estimate(key), key) for key in candidates),
+                                key=lambda item: item[0])
+        self.top = {}
+        self._heap = []
+        for estimate, key in ranked:
+            self._track(key, estimate)
+
+    def most_common(self, n=None):
+        ranked = sorted(self.top.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:self.k if n is None else min(n, self.k)]
+
+
+class HyperLogLog:
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @classmethod
+    def from_error(cls, error=0.01):
+        # the standard error of the estimate is about 1.04 / sqrt(registers)
+        return cls(min(max(math.ceil(math.log2((1.04 / error) ** 2)), 4), 18))
+
+    def add(self, key, hashed=None):
+        hashed = stable_hash(key) if hashed is None else hashed
+        rest_bits = _HASH_BITS - self.precision
+        register = hashed >> rest_bits
+        rank = rest_bits - (hashed & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def estimate(self):
+        registers = self.registers
+        m = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -rank for rank in registers)
+        zeros = registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # linear counting is more accurate while many registers are still empty
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise ValueError("only sketches of the same precision can be merged")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+
+class ExactTopK:
+    def __init__(self, k=10):
+        self.k = k
+        self.counts = Counter()
+
+    def add(self, key, count=1, hashed=None):
+        self.counts[key] += count
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def most_common(self, n=None):
+        return self.counts.most_common(self.k if n is None else min(n, self.k))
+
+
+class ExactDistinct:
+    def __init__(self):
+        self.values = set()
+
+    def add(self, key, hashed=None):
+        self.values.add(key)
+
+    def estimate(self):
+        return len(self.values)
+
+    def merge(self, other):
+        self.values |= other.values
+
+
+class LogSketch:
+    # One pass over raw http.log lines in fixed memory: top-k sources, URIs and hosts, and distinct uids and
+    # sources. Fields stay unparsed strings; exact=True swaps in counters and sets for validating the sketches,
+    # and strict=True skips the lines HttpLog would reject, at the cost of decoding every field.
+    def __init__(self, k=10, epsilon=0.001, delta=0.01, error=0.01, exact=False, strict=False):
+        self.exact = exact
+        self.strict = strict
+        self.lines = 0
+        if exact:
+            self.top_sources, self.top_uris, self.top_hosts = ExactTopK(k), ExactTopK(k), ExactTopK(k)
+            self.distinct_uids, self.distinct_sources = ExactDistinct(), ExactDistinct()
+        else:
+            self.top_sources, self.top_uris, self.top_hosts = (TopK(k, epsilon, delta) for _ in range(3))
+            self.distinct_uids, self.distinct_sources = HyperLogLog.from_error(error), HyperLogLog.from_error(error)
+
+    def add_line(self, line):
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) < 15 or fields[0].startswith('#'):
+            return
+        if self.strict:
+            try:
+                decode_fields(fields)
+            except ValueError:
+                return
+        self.lines += 1
+
+        source = fields[2]
+        hashed = None if self.exact else stable_hash(source)
+        self.top_sources.add(source, hashed=hashed)
+        self.distinct_sources.add(source, hashed=hashed)
+        self.distinct_uids.add(fields[1])
+        self.top_uris.add(fields[9])
+        self.top_hosts.add(fields[8])
+
+    def update(self, lines):
+        for line in lines:
+            self.add_line(line)
+        return self
+
+    def merge(self, other):
+        self.lines += other.lines
+        for name in ('top_sources', 'top_uris', 'top_hosts', 'distinct_uids', 'distinct_sources'):
+            getattr(self, name).merge(getattr(other, name))
+        return self
+
+    def to_dict(self, n=None):
+        return {
+            'lines': self.lines,
+            'top_sources': self.top_sources.most_common(n),
+            'top_uris': self.top_uris.most_common(n),
+            'top_hosts': self.top_hosts.most_common(n),
+            'distinct_uids': self.distinct_uids.estimate(),
+            'distinct_sources': self.distinct_sources.estimate()
+        }
+
+
+def _sketch_range(path, start, end, options):
+    return LogSketch(**options).update(parallel_reader.read_range(path, start, end))
+
+
+def _sketch_file(path, options):
+    return LogSketch(**options).update(log_sources.iter_lines([path]))
+
+
+def sketch_log(path, workers=1, **options):
+    # path may be a plain, compressed or globbed log; with workers > 1 partial sketches are merged
+    paths = log_sources.expand(path)
+    if workers <= 1:
+        return LogSketch(**options).update(log_sources.iter_lines(paths))
+
+    if paths == [path] and not log_sources.is_compressed(path):
+        partials = parallel_reader.map_ranges(path, _sketch_range, workers, options)
+    else:
+        partials = parallel_reader.map_files(paths, _sketch_file, workers, options)
+
+    sketch = LogSketch(**options)
+    for partial in partials:
+        sketch.merge(partial)
+    return sketch
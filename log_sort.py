@@ -0,0 +1,262 @@
+import array
+import heapq
+import ipaddress
+import os
+import pickle
+import tempfile
+
+import log_sources
+from log_columns import DICTIONARY_COLUMNS, ColumnStore, IpColumn
+from log_entry import HttpLogEntry, decode_fields
+from log_views import readable
+from time_index import _row_array
+
+MEMORY_LIMIT = 256 << 20
+SPILL_BATCH = 10000
+
+_ADDRESS_TYPES = (ipaddress.IPv4Address, ipaddress.IPv6Address)
+# positions in the tuple returned by decode_fields
+_VALUE_POSITIONS = {name: position for position, name in enumerate(
+    ['ts', 'uid', 'id_orig_h', 'id_orig_p', 'id_resp_h', 'id_resp_p', 'method', 'host', 'uri',
+     'request_body_len', 'response_body_len', 'stat_code'])}
+# timestamps sort like the epochs every entry keeps
+_FIELD_ALIASES = {'timestamp': 'ts'}
+# approximate per-line overhead of a (key, sequence, line) tuple held while sorting, and how much larger a
+# parsed HttpLogEntry is than its line
+_ITEM_OVERHEAD = 200
+_ENTRY_EXPANSION = 10
+
+
+def parse_keys(keys):
+    # 'field' sorts ascending, '-field' descending
+    parsed = []
+    for key in keys:
+        descending = key.startswith('-')
+        field = key[1:] if descending else key
+        parsed.append((_FIELD_ALIASES.get(field, field), descending))
+    return parsed
+
+
+def _address_key(addr):
+    # IPv4 and IPv6 addresses do not compare with each other; IPv4 sorts first
+    return addr.version, int(addr)
+
+
+class SortIndex:
+    # Per-column sort permutations cached for one set of entries. Next to each permutation a rank per row is
+    # kept (equal values, equal rank), so a multi-key sort is a few stable sorts of a cached permutation.
+    def __init__(self, entries):
+        self.entries = entries
+        self._columns = {}
+        self._sorted = {}
+
+    def permutation(self, *keys):
+        keys = tuple(parse_keys(keys))
+        if not keys:
+            return range(len(self.entries))
+
+        rows = self._sorted.get(keys)
+        if rows is None:
+            field, descending = keys[-1]
+            order, ranks = self._column(field)
+            if descending:
+                rows = _row_array(sorted(order, key=ranks.__getitem__, reverse=True), len(order))
+            else:
+                rows = order
+            # least significant key first; every later sort is stable, so earlier orders break its ties
+            for field, descending in reversed(keys[:-1]):
+                ranks = self._column(field)[1]
+                rows = _row_array(sorted(rows, key=ranks.__getitem__, reverse=descending), len(rows))
+            self._sorted[keys] = rows
+        return rows
+
+    def _column(self, field):
+        column = self._columns.get(field)
+        if column is None:
+            if isinstance(self.entries, ColumnStore):
+                column = self._store_column(field)
+            else:
+                column = self._entry_column(field)
+            self._columns[field] = column
+        return column
+
+    def _store_column(self, field):
+        store = self.entries
+        count = len(store)
+
+        if field in DICTIONARY_COLUMNS:
+            # dictionary values are distinct, so sorting them once gives every code its rank
+            values = [_address_key(value) if isinstance(value, _ADDRESS_TYPES) else value
+                      for value in getattr(store, field).values]
+            code_ranks = array.array('I', bytes(4 * len(values)))
+            for rank, code in enumerate(sorted(range(len(values)), key=values.__getitem__)):
+                code_ranks[code] = rank
+            ranks = array.array('I', map(code_ranks.__getitem__, store.get_array(field + '_codes')))
+            return _row_array(sorted(range(count), key=ranks.__getitem__), count), ranks
+
+        column = getattr(store, field)
+        if isinstance(column, IpColumn):
+            hi, lo = column.hi, column.lo
+            # IPv4 rows are IPv4-mapped, so (hi, lo) order is address order within each version
+            order = sorted(range(count), key=lo.__getitem__)
+            order = sorted(order, key=hi.__getitem__)
+            is_v6 = bytes(h != 0 or l >> 32 != 0xffff for h, l in zip(hi, lo))
+            order = sorted(order, key=is_v6.__getitem__)
+            return self._ranked(order, lambda row: (hi[row], lo[row]))
+
+        # a numeric column already is a rank
+        return _row_array(sorted(range(count), key=column.__getitem__), count), column
+
+    def _entry_column(self, field):
+        entries = self.entries
+        keys = {}
+        for row, entry in readable(entries):
+            value = getattr(entry, field)
+            keys[row] = _address_key(value) if isinstance(value, _ADDRESS_TYPES) else value
+
+        # as in TimeIndex, rows that cannot be decoded are left out of the permutation
+        order = sorted(keys, key=keys.__getitem__)
+        return self._ranked(order, keys.__getitem__, len(entries))
+
+    def _ranked(self, order, key, count=None):
+        ranks = array.array('I', bytes(4 * (len(order) if count is None else count)))
+        rank = 0
+        previous = _MISSING
+        for row in order:
+            value = key(row)
+            if value != previous:
+                rank += 1
+                previous = value
+            ranks[row] = rank
+        return _row_array(order, len(order)), ranks
+
+
+class _Missing:
+    def __eq__(self, other):
+        return other is self
+
+    def __hash__(self):
+        return 0
+
+
+_MISSING = _Missing()
+
+
+class _Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _line_key(keys):
+    positions = [(_VALUE_POSITIONS[field], descending) for field, descending in keys]
+
+    def key(line):
+        values = decode_fields(line.strip().split('\t'))
+        parts = []
+        for position, descending in positions:
+            value = values[position]
+            if isinstance(value, _ADDRESS_TYPES):
+                value = _address_key(value)
+            parts.append(_Descending(value) if descending else value)
+        return tuple(parts)
+
+    return key
+
+
+def _spill(items, tmp_dir):
+    f = tempfile.TemporaryFile(dir=tmp_dir)
+    for start in range(0, len(items), SPILL_BATCH):
+        pickle.dump(items[start:start + SPILL_BATCH], f, pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+
+def _read_spill(f):
+    with f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+def external_sort(lines, *keys, memory_limit=MEMORY_LIMIT, tmp_dir=None):
+    # Sorts raw http.log lines on parsed fields and yields them in order. Runs that outgrow memory_limit are
+    # sorted and spilled to temporary files, which are then merged; lines that do not parse are dropped.
+    key = _line_key(parse_keys(keys))
+    spills = []
+    items = []
+    size = 0
+
+    for sequence, line in enumerate(lines):
+        try:
+            items.append((key(line), sequence, line))
+        except ValueError:
+            continue
+        size += len(line) + _ITEM_OVERHEAD
+        if size >= memory_limit:
+            items.sort()
+            spills.append(_spill(items, tmp_dir))
+            items = []
+            size = 0
+
+    items.sort()
+    if not spills:
+        for _, _, line in items:
+            yield line
+        return
+
+    # the sequence number keeps the merge stable and means lines themselves are never compared
+    try:
+        for _, _, line in heapq.merge(*map(_read_spill, spills), iter(items)):
+            yield line
+    finally:
+        for f in spills:
+            f.close()
+
+
+def iter_sorted(log_file, *keys, memory_limit=MEMORY_LIMIT, tmp_dir=None):
+    # yields HttpLogEntry rows of a log (plain, compressed or globbed) in key order, in memory when the files
+    # fit the budget and by external merge sort when they do not
+    paths = log_sources.expand(log_file)
+    lines = log_sources.iter_lines(paths)
+    in_memory = sum(map(os.path.getsize, paths)) * _ENTRY_EXPANSION <= memory_limit
+    if in_memory and not any(map(log_sources.is_compressed, paths)):
+        entries = []
+        for line in lines:
+            try:
+                entries.append(HttpLogEntry(line))
+            except ValueError:
+                continue
+        for row in SortIndex(entries).permutation(*keys):
+            yield entries[row]
+        return
+
+    for line in external_sort(lines, *keys, memory_limit=memory_limit, tmp_dir=tmp_dir):
+        yield HttpLogEntry(line)
+
+
+
+def test_external_sort(path='http_first_100k.log', memory_limit=1 << 20):
+    # external merge sort with a budget that spills many runs, against the in-memory sort of the same rows
+    with open(path) as f:
+        lines = f.readlines()
+    assert sum(map(len, lines)) > 4 * memory_limit
+    store = ColumnStore.from_lines(lines)
+    index = SortIndex(store)
+
+    for keys in (('ts',), ('-stat_code', 'uri'), ('id_orig_h', '-ts'), ('method', 'host')):
+        expected = [(store[row].ts, store[row].uid) for row in index.permutation(*keys)]
+        sorted_lines = external_sort(lines, *keys, memory_limit=memory_limit)
+        merged = [(entry.ts, entry.uid) for entry in map(HttpLogEntry, sorted_lines)]
+        assert merged == expected, keys
+        print(f"{', '.join(keys)}: {len(merged)} rows")
@@ -0,0 +1,95 @@
+import bz2
+import glob
+import gzip
+import io
+import locale
+import lzma
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BLOCK_SIZE = 1 << 20
+# a directory stands for the Zeek http logs in it, current and rotated, compressed or not
+DIRECTORY_PATTERN = 'http*.log*'
+
+
+def _open_zstd(f):
+    if zstandard is None:
+        raise ImportError("reading .zst logs needs the zstandard package")
+    return zstandard.ZstdDecompressor().stream_reader(f, read_size=BLOCK_SIZE, read_across_frames=True)
+
+
+_DECOMPRESSORS = {
+    '.gz': lambda f: gzip.GzipFile(fileobj=f, mode='rb'),
+    '.bz2': bz2.BZ2File,
+    '.xz': lzma.LZMAFile,
+    '.zst': _open_zstd,
+}
+
+
+def is_compressed(path):
+    return os.path.splitext(path)[1] in _DECOMPRESSORS
+
+
+def is_pattern(path):
+    # an existing file is taken literally, even if its name happens to contain glob characters
+    return os.path.isdir(path) or (not os.path.exists(path) and glob.escape(path) != path)
+
+
+def expand(path):
+    if os.path.isdir(path):
+        path = os.path.join(glob.escape(path), DIRECTORY_PATTERN)
+    elif not is_pattern(path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File {path} not found.")
+        return [path]
+
+    # rotated Zeek logs carry their start time in the name, so name order is time order
+    paths = sorted(match for match in glob.glob(path) if os.path.isfile(match))
+    if not paths:
+        raise FileNotFoundError(f"No files match {path}.")
+    return paths
+
+
+class LogStream:
+    # Binary line stream over a plain or compressed file. Decompression runs in BLOCK_SIZE reads, and
+    # position() reports how far into the file on disk (i.e. the compressed bytes) reading has got.
+    def __init__(self, path, block_size=BLOCK_SIZE):
+        self.path = path
+        self.file = open(path, 'rb', buffering=block_size)
+        decompressor = _DECOMPRESSORS.get(os.path.splitext(path)[1])
+        try:
+            self.stream = self.file if decompressor is None else io.BufferedReader(decompressor(self.file),
+                                                                                   block_size)
+        except BaseException:
+            self.file.close()
+            raise
+
+    def position(self):
+        return self.file.tell()
+
+    def __iter__(self):
+        return iter(self.stream)
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_lines(paths, encoding=None):
+    encoding = encoding or locale.getpreferredencoding(False)
+    for path in paths:
+        with LogStream(path) as f:
+            for raw in f:
+                yield raw.decode(encoding)
@@ -0,0 +1,43 @@
+import array
+
+
+def readable(entries, rows=None):
+    # (row, entry) for each row whose entry decodes. Lazily decoded and mapped entries can fail when read;
+    # every reader of the entries goes through here, so such rows are left out the same way everywhere.
+    if rows is None:
+        rows = range(len(entries))
+    for row in rows:
+        try:
+            yield row, entries[row].check()
+        except ValueError:
+            continue
+
+
+def nearest_readable(entries, row, step=1):
+    # the first readable (row, entry) from row on in the direction of step, e.g. for Previous/Next; None past the end
+    stop = len(entries) if step > 0 else -1
+    return next(readable(entries, range(row, stop, step)), None)
+
+
+class EntryView:
+    def __init__(self, entries, rows):
+        self.entries = entries
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return EntryView(self.entries, self.rows[index])
+        return self.entries[self.rows[index]]
+
+    def __add__(self, other):
+        # views over the same entries concatenate their rows only
+        if not isinstance(other, EntryView) or other.entries is not self.entries:
+            return NotImplemented
+        return EntryView(self.entries, array.array('Q', self.rows) + array.array('Q', other.rows))
+
+    def __iter__(self):
+        for _, entry in readable(self.entries, self.rows):
+            yield entry
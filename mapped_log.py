@@ -0,0 +1,151 @@
+import array
+import locale
+import mmap
+import os
+import struct
+
+from log_entry import HttpLogEntry, LazyHttpLogEntry, decode_ts
+from log_views import readable
+
+INDEX_SUFFIX = '.idx'
+_INDEX_MAGIC = b'HLIDX001'
+_INDEX_HEADER = struct.Struct('<8sQQQ')
+
+
+def build_offsets(data):
+    offsets = array.array('Q')
+    size = len(data)
+    pos = 0
+
+    while pos < size:
+        end = data.find(b'\n', pos)
+        if end == -1:
+            end = size
+        # blank lines and Zeek '#' header lines never hold entries, so they are left out of the index
+        if end > pos and data[pos] not in b'#\r':
+            offsets.append(pos)
+        pos = end + 1
+
+    return offsets
+
+
+def index_path(log_file):
+    return log_file + INDEX_SUFFIX
+
+
+def save_index(log_file, offsets):
+    stat = os.stat(log_file)
+    with open(index_path(log_file), 'wb') as f:
+        f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(offsets)))
+        offsets.tofile(f)
+
+
+def load_index(log_file):
+    try:
+        f = open(index_path(log_file), 'rb')
+    except FileNotFoundError:
+        return None
+
+    with f:
+        header = f.read(_INDEX_HEADER.size)
+        if len(header) < _INDEX_HEADER.size:
+            return None
+        magic, size, mtime_ns, count = _INDEX_HEADER.unpack(header)
+        stat = os.stat(log_file)
+        if magic != _INDEX_MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+            return None
+        if count == 0:
+            return array.array('Q')
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapped)[_INDEX_HEADER.size:_INDEX_HEADER.size + count * 8]
+    if len(view) != count * 8:
+        return None
+    return view.cast('Q')
+
+
+_UNREAD, _READABLE, _MALFORMED = range(3)
+
+
+class MappedEntries:
+    # Rows are only parsed when read, so the index holds every entry line, malformed or not: len() counts
+    # lines, and a malformed row raises LogLineError when read. Readers go through log_views.readable(),
+    # which skips such rows. on_row(error, line) is called the first time each row is read, with error None
+    # for a row that parses, so accepted and rejected counts grow as rows are read.
+    def __init__(self, log_file, lazy=False, strict=False, persist_index=False, encoding=None, on_row=None):
+        self.log_file = log_file
+        self.lazy = lazy
+        self.strict = strict
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.on_row = on_row
+
+        with open(log_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                self._data = b''
+            else:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.offsets = load_index(log_file) if persist_index else None
+        if self.offsets is None:
+            self.offsets = build_offsets(self._data)
+            if persist_index:
+                save_index(log_file, self.offsets)
+        self._state = bytearray(len(self.offsets))
+
+    def line(self, index):
+        start = self.offsets[index]
+        end = self._data.find(b'\n', start)
+        if end == -1:
+            end = len(self._data)
+        return self._data[start:end].decode(self.encoding)
+
+    def epochs(self):
+        # reads only the leading ts field of every line; unreadable ones become NaN
+        epochs = array.array('d')
+        data = self._data
+
+        for start in self.offsets:
+            end = data.find(b'\t', start, start + 64)
+            try:
+                epochs.append(decode_ts(data[start:end if end != -1 else start]))
+            except ValueError:
+                epochs.append(float('nan'))
+
+        return epochs
+
+    def _parse(self, index):
+        line = self.line(index)
+        state = self._state[index]
+        try:
+            entry = LazyHttpLogEntry(line, self.strict) if self.lazy else HttpLogEntry(line)
+            if state == _UNREAD:
+                # a lazy entry is decoded once, so a malformed row is found on its first read
+                entry.check()
+        except ValueError as e:
+            if state == _UNREAD:
+                self._state[index] = _MALFORMED
+                if self.on_row is not None:
+                    self.on_row(e, line)
+            raise
+
+        if state == _UNREAD:
+            self._state[index] = _READABLE
+            if self.on_row is not None:
+                self.on_row(None, line)
+        return entry
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._parse(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("entry index out of range")
+        return self._parse(index)
+
+    def __iter__(self):
+        for _, entry in readable(self):
+            yield entry
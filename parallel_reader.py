@@ -0,0 +1,77 @@
+import concurrent.futures
+import locale
+import os
+
+CHUNKS_PER_WORKER = 4
+
+
+def complete_size(path, block=1 << 16):
+    # bytes up to and including the last newline, i.e. without a last line that is still being written
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        end = size
+        while end > 0:
+            start = max(end - block, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def split_ranges(path, parts, size=None):
+    if size is None:
+        size = os.path.getsize(path)
+    bounds = [0]
+
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            pos = max(size * i // parts, bounds[-1])
+            if pos == 0:
+                continue
+            # finish the line that contains pos - 1, so every range starts at a line boundary
+            f.seek(pos - 1)
+            f.readline()
+            bounds.append(min(f.tell(), size))
+
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def read_range(path, start, end, encoding=None):
+    encoding = encoding or locale.getpreferredencoding(False)
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        for raw in f:
+            if pos >= end:
+                break
+            pos += len(raw)
+            yield raw.decode(encoding)
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def map_ranges(path, func, workers=None, *args, size=None):
+    # size limits the ranges to the first size bytes of the file
+    workers = workers or default_workers()
+    ranges = split_ranges(path, workers * CHUNKS_PER_WORKER, size)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(func, path, start, end, *args) for start, end in ranges]
+        for future in futures:
+            yield future.result()
+
+
+def map_files(paths, func, workers=None, *args):
+    # one task per file: compressed files cannot be split, but separate files decompress independently
+    workers = min(workers or default_workers(), len(paths))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(func, path, *args) for path in paths]
+        for future in futures:
+            yield future.result()
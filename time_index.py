@@ -0,0 +1,60 @@
+import array
+import bisect
+import datetime
+from itertools import islice
+
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def to_epoch(value):
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time.min).timestamp()
+    return float(value)
+
+
+def parse_date(text, end=False):
+    # 'YYYY-MM-DD HH:MM:SS', or a whole day 'YYYY-MM-DD' meaning its first moment (its last with end=True)
+    try:
+        return datetime.datetime.strptime(text, DATETIME_FORMAT)
+    except ValueError:
+        day = datetime.datetime.strptime(text, DATE_FORMAT)
+    return datetime.datetime.combine(day, datetime.time.max if end else datetime.time.min)
+
+
+def _row_array(rows, count):
+    return array.array('I' if count < 1 << 32 else 'Q', rows)
+
+
+class TimeIndex:
+    def __init__(self, epochs):
+        count = len(epochs)
+
+        # NaN marks rows whose timestamp could not be read; it fails every comparison, so such a log is never
+        # treated as sorted and those rows are left out of the permutation
+        if all(a <= b for a, b in zip(epochs, islice(epochs, 1, None))) and all(ts == ts for ts in islice(epochs, 1)):
+            self.order = None
+            self.epochs = epochs
+        else:
+            order = sorted((row for row in range(count) if epochs[row] == epochs[row]), key=epochs.__getitem__)
+            self.order = _row_array(order, count)
+            self.epochs = array.array('d', (epochs[row] for row in order))
+
+    def bounds(self, start=None, end=None):
+        lo = 0 if start is None else bisect.bisect_left(self.epochs, to_epoch(start))
+        hi = len(self.epochs) if end is None else bisect.bisect_right(self.epochs, to_epoch(end))
+        return lo, max(lo, hi)
+
+    def rows(self, start=None, end=None):
+        lo, hi = self.bounds(start, end)
+        if self.order is None:
+            return range(lo, hi)
+        return self.order[lo:hi]
+
+    def min(self):
+        return self.epochs[0] if len(self.epochs) else None
+
+    def max(self):
+        return self.epochs[-1] if len(self.epochs) else None